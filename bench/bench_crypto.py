@@ -0,0 +1,99 @@
+"""Per-call cost of the crypto helpers: uncached baseline vs cached.
+
+Run with ``python -m bench.bench_crypto``.
+"""
+import base64
+import hashlib
+import hmac
+import timeit
+
+from cryptography.fernet import Fernet
+
+from bot.security.crypto import (
+    decrypt_many,
+    decrypt_text,
+    encrypt_many,
+    encrypt_text,
+    hash_many,
+    telegram_id_hash,
+)
+
+KEY = Fernet.generate_key().decode("utf-8")
+SECRET = "bench-app-secret"
+TELEGRAM_ID = 123456789
+BATCH = 1000
+NUMBER = 5000
+
+
+def baseline_encrypt(key: str, value: str) -> str:
+    return Fernet(key.encode("utf-8")).encrypt(value.encode("utf-8")).decode()
+
+
+def baseline_decrypt(key: str, value: str) -> str:
+    return Fernet(key.encode("utf-8")).decrypt(value.encode("utf-8")).decode()
+
+
+def baseline_hash(secret: str, telegram_id: int) -> str:
+    digest = hmac.new(
+        secret.encode("utf-8"),
+        str(telegram_id).encode("utf-8"),
+        hashlib.sha256,
+    ).digest()
+    return base64.urlsafe_b64encode(digest).decode("utf-8")
+
+
+def per_call_us(func, number: int = NUMBER) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def main() -> None:
+    token = encrypt_text(KEY, str(TELEGRAM_ID))
+    ids = list(range(TELEGRAM_ID, TELEGRAM_ID + BATCH))
+    plain = [str(i) for i in ids]
+    tokens = encrypt_many(KEY, plain)
+
+    rows = [
+        (
+            "encrypt",
+            per_call_us(lambda: baseline_encrypt(KEY, plain[0])),
+            per_call_us(lambda: encrypt_text(KEY, plain[0])),
+        ),
+        (
+            "decrypt",
+            per_call_us(lambda: baseline_decrypt(KEY, token)),
+            per_call_us(lambda: decrypt_text(KEY, token)),
+        ),
+        (
+            "hash",
+            per_call_us(lambda: baseline_hash(SECRET, TELEGRAM_ID)),
+            per_call_us(lambda: telegram_id_hash(SECRET, TELEGRAM_ID)),
+        ),
+        (
+            "encrypt_many/item",
+            per_call_us(lambda: [baseline_encrypt(KEY, v) for v in plain], 5)
+            / BATCH,
+            per_call_us(lambda: encrypt_many(KEY, plain), 5) / BATCH,
+        ),
+        (
+            "decrypt_many/item",
+            per_call_us(lambda: [baseline_decrypt(KEY, v) for v in tokens], 5)
+            / BATCH,
+            per_call_us(lambda: decrypt_many(KEY, tokens), 5) / BATCH,
+        ),
+        (
+            "hash_many/item",
+            per_call_us(lambda: [baseline_hash(SECRET, i) for i in ids], 5)
+            / BATCH,
+            per_call_us(lambda: hash_many(SECRET, ids), 5) / BATCH,
+        ),
+    ]
+    print("%-20s %12s %12s %8s" % ("op", "before, us", "after, us", "speedup"))
+    for name, before, after in rows:
+        print(
+            "%-20s %12.2f %12.2f %7.2fx"
+            % (name, before, after, before / after)
+        )
+
+
+if __name__ == "__main__":
+    main()
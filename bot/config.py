@@ -21,9 +21,17 @@ class Settings(BaseSettings):
     webhook_base_url: str
     tinkoff_terminal_key: str | None = None
     tinkoff_secret: str | None = None
+    tinkoff_api_url: str = "https://securepay.tinkoff.ru/v2/"
     admin_password_hash: str
     admin_password_salt: str
     app_secret: str
+    telegram_webhook_secret: str | None = None
+    telegram_webhook_enabled: bool = False
+    bot_connection_limit: int = 100
+    scheduler_shards: int = 1
+    security_log_retention_days: int = 90
+    security_log_archive_dir: str = "./data/security_logs"
+    metrics_port: int | None = None
 
     @property
     def admin_ids(self) -> list[int]:
@@ -0,0 +1,141 @@
+import itertools
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Hashable, Iterable
+
+from bot.metrics import counter, gauge
+
+SUBSCRIPTION_CACHE_SIZE = 10_000
+SUBSCRIPTION_CACHE_TTL_SECONDS = 60.0
+RECENT_PAYMENT_KEYS = 10_000
+
+MISSING = object()
+
+CACHE_LOOKUPS = counter(
+    "cache_lookups_total",
+    "In-process cache lookups by result",
+    ("cache", "result"),
+)
+CACHE_ENTRIES = gauge(
+    "cache_entries",
+    "Entries held by an in-process cache",
+    ("cache",),
+)
+
+
+@dataclass(frozen=True)
+class SubscriptionStatus:
+    user_id: int
+    subscription_end: datetime | None
+    is_active: bool
+
+
+class TTLCache:
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.name = name
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        # Invalidation versions, so a read that raced an invalidation does
+        # not store its stale value. Bounded like the data; versions dropped
+        # from it raise the floor that every untracked key reports.
+        self._counter = itertools.count(1)
+        self._versions: OrderedDict[Hashable, int] = OrderedDict()
+        self._version_floor = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            CACHE_LOOKUPS.inc(cache=self.name, result="miss")
+            return MISSING
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._data[key]
+            self._resized()
+            CACHE_LOOKUPS.inc(cache=self.name, result="miss")
+            return MISSING
+        self._data.move_to_end(key)
+        CACHE_LOOKUPS.inc(cache=self.name, result="hit")
+        return value
+
+    def version(self, key: Hashable) -> int:
+        return self._versions.get(key, self._version_floor)
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        version: int | None = None,
+    ) -> None:
+        # With a version from before the read, the value is dropped if the
+        # key was invalidated while it was being loaded.
+        if version is not None and self.version(key) != version:
+            return
+        self._data[key] = (self.clock() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        self._resized()
+
+    def invalidate(self, key: Hashable) -> None:
+        if self._data.pop(key, None) is not None:
+            self._resized()
+        self._versions[key] = next(self._counter)
+        self._versions.move_to_end(key)
+        while len(self._versions) > self.maxsize:
+            _, dropped = self._versions.popitem(last=False)
+            self._version_floor = max(self._version_floor, dropped)
+
+    def invalidate_many(self, keys: Iterable[Hashable]) -> None:
+        for key in keys:
+            self.invalidate(key)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._version_floor = next(self._counter)
+        self._versions.clear()
+        self._resized()
+
+    def _resized(self) -> None:
+        CACHE_ENTRIES.set(len(self._data), cache=self.name)
+
+
+class RecentKeys:
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._keys: OrderedDict[Hashable, None] = OrderedDict()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: Hashable) -> None:
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.maxsize:
+            self._keys.popitem(last=False)
+
+
+# telegram_id_hash -> SubscriptionStatus, or None for unknown users.
+subscription_cache = TTLCache(
+    "subscription",
+    SUBSCRIPTION_CACHE_SIZE,
+    SUBSCRIPTION_CACHE_TTL_SECONDS,
+)
+
+# Idempotency keys of payments committed by this process.
+recent_payment_keys = RecentKeys(RECENT_PAYMENT_KEYS)
@@ -0,0 +1,100 @@
+import importlib
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaOutOfDate(RuntimeError):
+    pass
+
+
+def has_column(connection: Connection, table: str, column: str) -> bool:
+    columns = inspect(connection).get_columns(table)
+    return any(item["name"] == column for item in columns)
+
+
+def create_index(
+    connection: Connection,
+    name: str,
+    table: str,
+    columns: tuple[str, ...],
+    unique: bool = False,
+) -> None:
+    connection.execute(
+        text(
+            "CREATE %sINDEX IF NOT EXISTS %s ON %s (%s)"
+            % ("UNIQUE " if unique else "", name, table, ", ".join(columns))
+        )
+    )
+
+
+# Applied in order; each module defines ``revision``, ``description`` and
+# ``upgrade(connection)``. m0001 builds missing tables from the current
+# models, so every later script must check the live schema before
+# changing it.
+MIGRATIONS = [
+    importlib.import_module("%s.%s" % (__name__, name))
+    for name in (
+        "m0001_baseline",
+        "m0002_payment_user",
+        "m0003_hot_path_indexes",
+        "m0004_job_leases",
+        "m0005_job_runs",
+        "m0006_inbox_claimed_at",
+    )
+]
+HEAD = MIGRATIONS[-1].revision
+
+
+def current_revision(engine: Engine) -> int:
+    # One indexed read; no reflection on the normal start path.
+    try:
+        with engine.connect() as connection:
+            value = connection.execute(
+                text("SELECT MAX(version) FROM schema_version")
+            ).scalar()
+    except DBAPIError:
+        return 0
+    return value or 0
+
+
+def check_revision(engine: Engine) -> None:
+    revision = current_revision(engine)
+    if revision != HEAD:
+        raise SchemaOutOfDate(
+            "Database schema is at revision %s, code expects %s. "
+            "Run: python -m bot.db.migrations upgrade" % (revision, HEAD)
+        )
+
+
+def upgrade(engine: Engine, target: int = HEAD) -> list[int]:
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE IF NOT EXISTS schema_version "
+                "(version INTEGER PRIMARY KEY)"
+            )
+        )
+    revision = current_revision(engine)
+    applied = []
+    for migration in MIGRATIONS:
+        if not revision < migration.revision <= target:
+            continue
+        # Each script and its version bump commit together.
+        with engine.begin() as connection:
+            logger.info(
+                "Applying migration %s: %s",
+                migration.revision,
+                migration.description,
+            )
+            migration.upgrade(connection)
+            connection.execute(
+                text("INSERT INTO schema_version (version) VALUES (:v)"),
+                {"v": migration.revision},
+            )
+        applied.append(migration.revision)
+    return applied
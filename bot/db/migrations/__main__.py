@@ -0,0 +1,27 @@
+import argparse
+import logging
+
+from sqlalchemy import create_engine
+
+from bot.config import get_settings
+from bot.db.migrations import HEAD, current_revision, upgrade
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m bot.db.migrations")
+    commands = parser.add_subparsers(dest="command", required=True)
+    up = commands.add_parser("upgrade", help="apply pending migrations")
+    up.add_argument("--to", type=int, default=HEAD, help="target revision")
+    commands.add_parser("current", help="show the database revision")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine = create_engine(get_settings().database_url, future=True)
+    if args.command == "upgrade":
+        applied = upgrade(engine, args.to)
+        print("Applied: %s" % (applied or "nothing"))
+    print("Revision %s (head %s)" % (current_revision(engine), HEAD))
+
+
+if __name__ == "__main__":
+    main()
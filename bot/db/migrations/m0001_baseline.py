@@ -0,0 +1,10 @@
+from sqlalchemy.engine import Connection
+
+revision = 1
+description = "Create missing tables"
+
+
+def upgrade(connection: Connection) -> None:
+    from bot.db.models import Base
+
+    Base.metadata.create_all(bind=connection)
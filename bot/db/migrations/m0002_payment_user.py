@@ -0,0 +1,38 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from bot.db.migrations import create_index, has_column
+
+revision = 2
+description = "Link payments to their user and tariff"
+
+
+def upgrade(connection: Connection) -> None:
+    if not has_column(connection, "payments", "user_id"):
+        connection.execute(
+            text(
+                "ALTER TABLE payments ADD COLUMN user_id INTEGER "
+                "REFERENCES users (id)"
+            )
+        )
+    create_index(connection, "ix_payments_user_id", "payments", ("user_id",))
+    if not has_column(connection, "payments", "tariff_code"):
+        connection.execute(
+            text("ALTER TABLE payments ADD COLUMN tariff_code VARCHAR(32)")
+        )
+    # Pending payments are the ones a webhook can still arrive for.
+    connection.execute(
+        text(
+            "UPDATE payments SET user_id = ("
+            "SELECT users.id FROM users "
+            "WHERE users.telegram_id_hash = payments.telegram_id_hash"
+            ") WHERE user_id IS NULL AND status = 'pending'"
+        )
+    )
+    connection.execute(
+        text(
+            "UPDATE payments SET tariff_code = SUBSTR(payload, 5) "
+            "WHERE tariff_code IS NULL AND status = 'pending' "
+            "AND payload LIKE 'sub\\_%' ESCAPE '\\'"
+        )
+    )
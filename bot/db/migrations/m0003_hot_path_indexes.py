@@ -0,0 +1,46 @@
+from sqlalchemy.engine import Connection
+
+from bot.db.migrations import create_index
+
+revision = 3
+description = "Indexes for expiry, invite, payment and audit lookups"
+
+
+def upgrade(connection: Connection) -> None:
+    create_index(
+        connection,
+        "ix_users_active_subscription_end",
+        "users",
+        ("is_active", "subscription_end"),
+    )
+    create_index(
+        connection,
+        "uq_invites_invite_link",
+        "invites",
+        ("invite_link",),
+        unique=True,
+    )
+    create_index(
+        connection,
+        "ix_invites_hash_used_expires_at",
+        "invites",
+        ("telegram_id_hash", "is_used", "expires_at"),
+    )
+    create_index(
+        connection,
+        "ix_payments_status_currency",
+        "payments",
+        ("status", "currency"),
+    )
+    create_index(
+        connection,
+        "ix_security_logs_created_at",
+        "security_logs",
+        ("created_at",),
+    )
+    create_index(
+        connection,
+        "ix_security_logs_hash_created_at",
+        "security_logs",
+        ("telegram_id_hash", "created_at"),
+    )
@@ -0,0 +1,10 @@
+from sqlalchemy.engine import Connection
+
+revision = 4
+description = "Leases that let one worker run each scheduler tick"
+
+
+def upgrade(connection: Connection) -> None:
+    from bot.db.models import JobLease
+
+    JobLease.__table__.create(bind=connection, checkfirst=True)
@@ -0,0 +1,10 @@
+from sqlalchemy.engine import Connection
+
+revision = 5
+description = "Last run of each scheduler job, for catch-up after restarts"
+
+
+def upgrade(connection: Connection) -> None:
+    from bot.db.models import JobRun
+
+    JobRun.__table__.create(bind=connection, checkfirst=True)
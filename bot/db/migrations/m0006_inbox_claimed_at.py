@@ -0,0 +1,14 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from bot.db.migrations import has_column
+
+revision = 6
+description = "Record when a Tinkoff inbox event was claimed"
+
+
+def upgrade(connection: Connection) -> None:
+    if not has_column(connection, "tinkoff_events", "claimed_at"):
+        connection.execute(
+            text("ALTER TABLE tinkoff_events ADD COLUMN claimed_at TIMESTAMP")
+        )
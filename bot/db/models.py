@@ -1,5 +1,15 @@
 from datetime import datetime
-from sqlalchemy import Boolean, DateTime, Integer, String, Text
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -9,6 +19,13 @@ class Base(DeclarativeBase):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index(
+            "ix_users_active_subscription_end",
+            "is_active",
+            "subscription_end",
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     telegram_id: Mapped[str] = mapped_column(Text, nullable=False)
@@ -32,6 +49,9 @@ class User(Base):
 
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        Index("ix_payments_status_currency", "status", "currency"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     telegram_id: Mapped[str] = mapped_column(Text, nullable=False)
@@ -40,6 +60,12 @@ class Payment(Base):
         index=True,
         nullable=False,
     )
+    user_id: Mapped[int | None] = mapped_column(
+        ForeignKey("users.id"),
+        index=True,
+        nullable=True,
+    )
+    tariff_code: Mapped[str | None] = mapped_column(String(32), nullable=True)
     amount: Mapped[int] = mapped_column(Integer, nullable=False)
     currency: Mapped[str] = mapped_column(String(8), nullable=False)
     method: Mapped[str] = mapped_column(String(16), nullable=False)
@@ -58,6 +84,15 @@ class Payment(Base):
 
 class Invite(Base):
     __tablename__ = "invites"
+    __table_args__ = (
+        Index("uq_invites_invite_link", "invite_link", unique=True),
+        Index(
+            "ix_invites_hash_used_expires_at",
+            "telegram_id_hash",
+            "is_used",
+            "expires_at",
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     telegram_id: Mapped[str] = mapped_column(Text, nullable=False)
@@ -71,8 +106,45 @@ class Invite(Base):
     expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
 
 
+class PooledInvite(Base):
+    __tablename__ = "invite_pool"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    invite_link: Mapped[str] = mapped_column(
+        Text,
+        unique=True,
+        nullable=False,
+    )
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        index=True,
+        nullable=False,
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        default=datetime.utcnow,
+    )
+
+
+class ProcessedPayment(Base):
+    __tablename__ = "processed_payments"
+
+    key: Mapped[str] = mapped_column(String(160), primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        default=datetime.utcnow,
+    )
+
+
 class SecurityLog(Base):
     __tablename__ = "security_logs"
+    __table_args__ = (
+        Index(
+            "ix_security_logs_hash_created_at",
+            "telegram_id_hash",
+            "created_at",
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     telegram_id: Mapped[str | None] = mapped_column(Text, nullable=True)
@@ -85,6 +157,7 @@ class SecurityLog(Base):
     meta: Mapped[str | None] = mapped_column(Text, nullable=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime,
+        index=True,
         default=datetime.utcnow,
     )
 
@@ -105,3 +178,124 @@ class AdminUser(Base):
         DateTime,
         default=datetime.utcnow,
     )
+
+
+class ReminderLog(Base):
+    __tablename__ = "reminder_logs"
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id",
+            "days",
+            "subscription_end",
+            name="uq_reminder_logs_user_days_end",
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    days: Mapped[int] = mapped_column(Integer, nullable=False)
+    subscription_end: Mapped[datetime] = mapped_column(
+        DateTime,
+        nullable=False,
+    )
+    sent_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        default=datetime.utcnow,
+    )
+
+
+class Broadcast(Base):
+    __tablename__ = "broadcasts"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    admin_chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    status: Mapped[str] = mapped_column(
+        String(16),
+        index=True,
+        nullable=False,
+    )
+    last_user_id: Mapped[int] = mapped_column(Integer, default=0)
+    sent: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        default=datetime.utcnow,
+    )
+    finished_at: Mapped[datetime | None] = mapped_column(
+        DateTime,
+        nullable=True,
+    )
+
+
+class StatCounter(Base):
+    __tablename__ = "stat_counters"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    value: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class MediaFile(Base):
+    __tablename__ = "media_files"
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    file_id: Mapped[str] = mapped_column(Text, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        default=datetime.utcnow,
+    )
+
+
+class JobLease(Base):
+    __tablename__ = "job_leases"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    owner: Mapped[str] = mapped_column(String(128), nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    acquired_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class JobRun(Base):
+    __tablename__ = "job_runs"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    last_run_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class TinkoffEvent(Base):
+    __tablename__ = "tinkoff_events"
+    __table_args__ = (
+        UniqueConstraint(
+            "order_id",
+            "status",
+            name="uq_tinkoff_events_order_status",
+        ),
+        Index("ix_tinkoff_events_state_next", "state", "next_attempt_at"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    order_id: Mapped[str] = mapped_column(String(128), nullable=False)
+    status: Mapped[str] = mapped_column(String(32), nullable=False)
+    payload: Mapped[str] = mapped_column(Text, nullable=False)
+    state: Mapped[str] = mapped_column(String(16), nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    next_attempt_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        default=datetime.utcnow,
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        default=datetime.utcnow,
+    )
+    claimed_at: Mapped[datetime | None] = mapped_column(
+        DateTime,
+        nullable=True,
+    )
+    processed_at: Mapped[datetime | None] = mapped_column(
+        DateTime,
+        nullable=True,
+    )
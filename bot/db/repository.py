@@ -1,152 +1,1021 @@
-from contextlib import contextmanager
-from datetime import datetime
-from typing import Iterable
+import functools
+import inspect
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Iterable
 
-from sqlalchemy import and_, select
+from sqlalchemy import (
+    and_,
+    case,
+    delete,
+    exists,
+    func,
+    insert,
+    or_,
+    select,
+    true,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from bot.db.models import Invite, Payment, SecurityLog, User
-from bot.db.session import SessionLocal
+from bot.db.cache import (
+    MISSING,
+    SubscriptionStatus,
+    recent_payment_keys,
+    subscription_cache,
+)
+from bot.db.models import (
+    Broadcast,
+    Invite,
+    JobLease,
+    JobRun,
+    MediaFile,
+    Payment,
+    PooledInvite,
+    ProcessedPayment,
+    ReminderLog,
+    SecurityLog,
+    StatCounter,
+    TinkoffEvent,
+    User,
+)
+from bot.db.session import AsyncSessionLocal
+from bot.metrics import histogram
 
 
-@contextmanager
-def get_session():
-    session = SessionLocal()
-    try:
+STALE_HASHES_KEY = "stale_subscription_hashes"
+STAT_DELTAS_KEY = "stat_deltas"
+PAYMENT_KEYS_KEY = "payment_keys"
+
+STAT_USERS_TOTAL = "users_total"
+STAT_SUBSCRIPTIONS_ACTIVE = "subscriptions_active"
+STAT_REVENUE_PREFIX = "revenue:"
+STAT_USERS_CREATED_PREFIX = "users_created:"
+
+
+def _invalidate_subscription(session: AsyncSession, digest: str) -> None:
+    # Dropped now and again once the transaction ends, so a reader that
+    # re-cached the pre-commit row in between does not keep it for a TTL.
+    subscription_cache.invalidate(digest)
+    session.info.setdefault(STALE_HASHES_KEY, set()).add(digest)
+
+
+def _dialect_insert(session: AsyncSession):
+    if session.bind.dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
+
+
+def _bump_stats(session: AsyncSession, **deltas: int) -> None:
+    pending = session.info.setdefault(STAT_DELTAS_KEY, {})
+    for name, delta in deltas.items():
+        pending[name] = pending.get(name, 0) + delta
+
+
+async def _apply_stat_deltas(session: AsyncSession) -> None:
+    # Applied right before commit so the shared counter rows are locked only
+    # for the commit itself, not for the whole (possibly slow) transaction.
+    pending = session.info.pop(STAT_DELTAS_KEY, None)
+    rows = [
+        {"name": name, "value": delta}
+        for name, delta in sorted((pending or {}).items())
+        if delta
+    ]
+    if not rows:
+        return
+    stmt = _dialect_insert(session)(StatCounter)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[StatCounter.name],
+        set_={"value": StatCounter.value + stmt.excluded.value},
+    )
+    await session.execute(stmt, rows)
+
+
+def _track_subscribed(
+    session: AsyncSession,
+    was_subscribed: bool,
+    is_subscribed: bool,
+) -> None:
+    if was_subscribed != is_subscribed:
+        delta = 1 if is_subscribed else -1
+        _bump_stats(session, **{STAT_SUBSCRIPTIONS_ACTIVE: delta})
+
+
+def _users_created_key(day: datetime) -> str:
+    return STAT_USERS_CREATED_PREFIX + day.strftime("%Y-%m-%d")
+
+
+def _is_subscribed(user: User) -> bool:
+    # The active-subscriptions counter tracks active rows with an end date;
+    # lapsed rows leave it when the expiration sweep deactivates them.
+    return bool(user.is_active and user.subscription_end is not None)
+
+
+@asynccontextmanager
+async def get_session():
+    async with AsyncSessionLocal() as session:
+        try:
+            yield session
+            await _apply_stat_deltas(session)
+            await session.commit()
+            for key in session.info.pop(PAYMENT_KEYS_KEY, ()):
+                recent_payment_keys.add(key)
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            session.info.pop(STAT_DELTAS_KEY, None)
+            session.info.pop(PAYMENT_KEYS_KEY, None)
+            subscription_cache.invalidate_many(
+                session.info.pop(STALE_HASHES_KEY, ())
+            )
+
+
+@asynccontextmanager
+async def unit_of_work(session: AsyncSession | None = None):
+    # Joins the caller's transaction when one is passed in, so multi-step
+    # flows commit once instead of once per repository call.
+    if session is not None:
         yield session
-        session.commit()
-    except Exception:
-        session.rollback()
-        raise
-    finally:
-        session.close()
+        return
+    async with get_session() as own:
+        yield own
 
 
-def get_user_by_hash(telegram_id_hash: str) -> User | None:
-    with get_session() as session:
+async def get_user_by_hash(
+    telegram_id_hash: str,
+    session: AsyncSession | None = None,
+) -> User | None:
+    async with unit_of_work(session) as session:
         stmt = select(User).where(User.telegram_id_hash == telegram_id_hash)
-        return session.execute(stmt).scalars().first()
+        return (await session.execute(stmt)).scalars().first()
 
 
-def upsert_user(user: User) -> User:
-    with get_session() as session:
+async def get_subscription_status(
+    telegram_id_hash: str,
+    session: AsyncSession | None = None,
+) -> SubscriptionStatus | None:
+    # Inside a caller's transaction the row is read directly so the answer
+    # reflects its uncommitted writes; standalone reads go through the cache.
+    if session is None:
+        cached = subscription_cache.get(telegram_id_hash)
+        if cached is not MISSING:
+            return cached
+        version = subscription_cache.version(telegram_id_hash)
+    async with unit_of_work(session) as own:
+        stmt = select(User.id, User.subscription_end, User.is_active).where(
+            User.telegram_id_hash == telegram_id_hash
+        )
+        row = (await own.execute(stmt)).first()
+    status = SubscriptionStatus(*row) if row is not None else None
+    if session is None:
+        subscription_cache.set(telegram_id_hash, status, version)
+    return status
+
+
+async def upsert_user(
+    user: User,
+    session: AsyncSession | None = None,
+) -> User:
+    async with unit_of_work(session) as session:
+        _invalidate_subscription(session, user.telegram_id_hash)
+        if user.id is None:
+            created_at = user.created_at or datetime.utcnow()
+            _bump_stats(
+                session,
+                **{
+                    STAT_USERS_TOTAL: 1,
+                    _users_created_key(created_at): 1,
+                },
+            )
+            if _is_subscribed(user):
+                _bump_stats(session, **{STAT_SUBSCRIPTIONS_ACTIVE: 1})
         session.add(user)
-        session.flush()
-        session.refresh(user)
+        await session.flush()
         return user
 
 
-def list_expired_users(now: datetime) -> Iterable[User]:
-    with get_session() as session:
-        stmt = select(User).where(
-            and_(
-                User.subscription_end.is_not(None),
-                User.subscription_end <= now,
-                User.is_active.is_(True),
+def _in_shard(hash_prefixes: Iterable[str] | None):
+    if hash_prefixes is None:
+        return true()
+    return func.substr(User.telegram_id_hash, 1, 1).in_(list(hash_prefixes))
+
+
+async def iter_expired_users(
+    now: datetime,
+    chunk_size: int,
+    hash_prefixes: Iterable[str] | None = None,
+) -> AsyncIterator[list[tuple[int, str, str]]]:
+    # Keyset pagination on the primary key: each page is a short read in its
+    # own session, so the sweep never holds a transaction across Bot API
+    # calls and rows skipped in an earlier page are not revisited.
+    last_id = 0
+    while True:
+        async with get_session() as session:
+            stmt = (
+                select(User.id, User.telegram_id, User.telegram_id_hash)
+                .where(
+                    and_(
+                        User.id > last_id,
+                        User.subscription_end.is_not(None),
+                        User.subscription_end <= now,
+                        User.is_active.is_(True),
+                        _in_shard(hash_prefixes),
+                    )
+                )
+                .order_by(User.id)
+                .limit(chunk_size)
             )
+            rows = [tuple(row) for row in await session.execute(stmt)]
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+async def deactivate_users(
+    users: Iterable[tuple[int, str]],
+    expired_before: datetime,
+    session: AsyncSession | None = None,
+) -> None:
+    users = list(users)
+    if not users:
+        return
+    async with unit_of_work(session) as session:
+        result = await session.execute(
+            update(User)
+            .where(
+                and_(
+                    User.id.in_([user_id for user_id, _ in users]),
+                    User.subscription_end <= expired_before,
+                    User.is_active.is_(True),
+                )
+            )
+            .values(is_active=False)
         )
-        return list(session.execute(stmt).scalars().all())
+        _bump_stats(session, **{STAT_SUBSCRIPTIONS_ACTIVE: -result.rowcount})
+        for _, digest in users:
+            _invalidate_subscription(session, digest)
 
 
-def list_users_for_reminder(
-    window_start: datetime,
-    window_end: datetime,
-) -> Iterable[User]:
-    with get_session() as session:
-        stmt = select(User).where(
-            and_(
-                User.subscription_end.is_not(None),
-                User.subscription_end > window_start,
-                User.subscription_end <= window_end,
-                User.is_active.is_(True),
+async def list_pending_reminders(
+    now: datetime,
+    reminder_days: Iterable[int],
+    hash_prefixes: Iterable[str] | None = None,
+) -> list[tuple[int, str, datetime, int]]:
+    # One range scan over (is_active, subscription_end) buckets every user
+    # into the reminder day whose [now + d, now + d + 1) window they fall in,
+    # skipping reminders already recorded for that subscription_end.
+    reminder_days = sorted(reminder_days)
+    windows = [
+        (days, now + timedelta(days=days), now + timedelta(days=days + 1))
+        for days in reminder_days
+    ]
+    bucket = case(
+        *[
+            (
+                and_(
+                    User.subscription_end > start,
+                    User.subscription_end <= end,
+                ),
+                days,
+            )
+            for days, start, end in windows
+        ],
+        else_=None,
+    )
+    already_sent = exists().where(
+        and_(
+            ReminderLog.user_id == User.id,
+            ReminderLog.days == bucket,
+            ReminderLog.subscription_end == User.subscription_end,
+        )
+    )
+    async with get_session() as session:
+        stmt = (
+            select(
+                User.id,
+                User.telegram_id,
+                User.subscription_end,
+                bucket.label("days"),
             )
+            .where(
+                and_(
+                    User.is_active.is_(True),
+                    User.subscription_end > windows[0][1],
+                    User.subscription_end <= windows[-1][2],
+                    bucket.is_not(None),
+                    ~already_sent,
+                    _in_shard(hash_prefixes),
+                )
+            )
+            .order_by(User.id)
         )
-        return list(session.execute(stmt).scalars().all())
+        return [tuple(row) for row in await session.execute(stmt)]
+
+
+async def add_reminder_logs(rows: list[dict]) -> None:
+    if not rows:
+        return
+    async with get_session() as session:
+        await session.execute(insert(ReminderLog), rows)
+
+
+async def delete_reminder_logs(rows: list[dict]) -> None:
+    if not rows:
+        return
+    async with get_session() as session:
+        for row in rows:
+            await session.execute(
+                delete(ReminderLog).where(
+                    and_(
+                        ReminderLog.user_id == row["user_id"],
+                        ReminderLog.days == row["days"],
+                        ReminderLog.subscription_end
+                        == row["subscription_end"],
+                    )
+                )
+            )
 
 
-def update_user_status(user_id: int, is_active: bool) -> None:
-    with get_session() as session:
-        user = session.get(User, user_id)
+async def update_user_status(
+    user_id: int,
+    is_active: bool,
+    session: AsyncSession | None = None,
+) -> None:
+    async with unit_of_work(session) as session:
+        user = await session.get(User, user_id)
         if user is None:
             return
+        was_subscribed = _is_subscribed(user)
         user.is_active = is_active
         session.add(user)
+        _track_subscribed(session, was_subscribed, _is_subscribed(user))
+        _invalidate_subscription(session, user.telegram_id_hash)
 
 
-def update_user_subscription(
+async def update_user_subscription(
     user_id: int,
     subscription_end: datetime,
     tariff: str,
+    session: AsyncSession | None = None,
 ) -> None:
-    with get_session() as session:
-        user = session.get(User, user_id)
+    async with unit_of_work(session) as session:
+        user = await session.get(User, user_id)
         if user is None:
             return
+        was_subscribed = _is_subscribed(user)
         user.subscription_end = subscription_end
         user.tariff = tariff
         user.is_active = True
         session.add(user)
+        _track_subscribed(session, was_subscribed, _is_subscribed(user))
+        _invalidate_subscription(session, user.telegram_id_hash)
 
 
-def add_payment(payment: Payment) -> Payment:
-    with get_session() as session:
+async def add_payment(
+    payment: Payment,
+    session: AsyncSession | None = None,
+) -> Payment:
+    async with unit_of_work(session) as session:
+        if payment.status == "paid":
+            _bump_stats(
+                session,
+                **{STAT_REVENUE_PREFIX + payment.currency: payment.amount},
+            )
         session.add(payment)
-        session.flush()
-        session.refresh(payment)
+        await session.flush()
         return payment
 
 
-def get_payment_by_order_id(order_id: str) -> Payment | None:
-    with get_session() as session:
+def is_recent_payment_key(key: str) -> bool:
+    return key in recent_payment_keys
+
+
+async def claim_payment_key(
+    key: str,
+    session: AsyncSession | None = None,
+) -> bool:
+    # Returns False when the key was already processed. Insert-or-ignore on
+    # the primary key settles concurrent deliveries in the database, and the
+    # claim commits or rolls back together with the caller's transaction.
+    if key in recent_payment_keys:
+        return False
+    async with unit_of_work(session) as session:
+        stmt = (
+            _dialect_insert(session)(ProcessedPayment)
+            .values(key=key, created_at=datetime.utcnow())
+            .on_conflict_do_nothing(index_elements=[ProcessedPayment.key])
+        )
+        claimed = (await session.execute(stmt)).rowcount > 0
+        session.info.setdefault(PAYMENT_KEYS_KEY, []).append(key)
+        return claimed
+
+
+async def get_payment_by_order_id(
+    order_id: str,
+    session: AsyncSession | None = None,
+) -> Payment | None:
+    async with unit_of_work(session) as session:
         stmt = select(Payment).where(Payment.order_id == order_id)
-        return session.execute(stmt).scalars().first()
+        return (await session.execute(stmt)).scalars().first()
+
+
+async def get_payment_with_user(
+    order_id: str,
+    session: AsyncSession | None = None,
+) -> tuple[Payment, User | None] | None:
+    async with unit_of_work(session) as session:
+        stmt = (
+            select(Payment, User)
+            .outerjoin(User, User.id == Payment.user_id)
+            .where(Payment.order_id == order_id)
+        )
+        row = (await session.execute(stmt)).first()
+        return (row[0], row[1]) if row else None
 
 
-def update_payment_status(payment_id: int, status: str) -> None:
-    with get_session() as session:
-        payment = session.get(Payment, payment_id)
+async def update_payment_status(
+    payment_id: int,
+    status: str,
+    session: AsyncSession | None = None,
+) -> None:
+    async with unit_of_work(session) as session:
+        payment = await session.get(Payment, payment_id)
         if payment is None:
             return
         payment.status = status
         session.add(payment)
 
 
-def add_security_log(log: SecurityLog) -> SecurityLog:
-    with get_session() as session:
+async def add_security_log(
+    log: SecurityLog,
+    session: AsyncSession | None = None,
+) -> SecurityLog:
+    async with unit_of_work(session) as session:
         session.add(log)
-        session.flush()
-        session.refresh(log)
+        await session.flush()
         return log
 
 
-def save_invite(invite: Invite) -> Invite:
-    with get_session() as session:
+async def add_security_logs(
+    rows: list[dict],
+    session: AsyncSession | None = None,
+) -> None:
+    if not rows:
+        return
+    async with unit_of_work(session) as session:
+        await session.execute(insert(SecurityLog), rows)
+
+
+async def list_security_logs_before(
+    cutoff: datetime,
+    limit: int,
+) -> list[SecurityLog]:
+    async with get_session() as session:
+        stmt = (
+            select(SecurityLog)
+            .where(SecurityLog.created_at < cutoff)
+            .order_by(SecurityLog.id)
+            .limit(limit)
+        )
+        return list((await session.execute(stmt)).scalars())
+
+
+async def delete_security_logs(ids: list[int]) -> int:
+    if not ids:
+        return 0
+    async with get_session() as session:
+        result = await session.execute(
+            delete(SecurityLog).where(SecurityLog.id.in_(ids))
+        )
+        return result.rowcount
+
+
+async def search_security_logs(
+    telegram_id_hash: str,
+    start: datetime,
+    end: datetime,
+) -> list[SecurityLog]:
+    async with get_session() as session:
+        stmt = (
+            select(SecurityLog)
+            .where(
+                and_(
+                    SecurityLog.telegram_id_hash == telegram_id_hash,
+                    SecurityLog.created_at >= start,
+                    SecurityLog.created_at < end,
+                )
+            )
+            .order_by(SecurityLog.created_at, SecurityLog.id)
+        )
+        return list((await session.execute(stmt)).scalars())
+
+
+async def save_invite(
+    invite: Invite,
+    session: AsyncSession | None = None,
+) -> Invite:
+    async with unit_of_work(session) as session:
         session.add(invite)
-        session.flush()
-        session.refresh(invite)
+        await session.flush()
         return invite
 
 
-def get_active_invite_for_user(telegram_id: int) -> Invite | None:
+async def get_active_invite_for_user(
+    telegram_id: int,
+    session: AsyncSession | None = None,
+) -> Invite | None:
     from bot.config import get_settings
     from bot.security.crypto import telegram_id_hash
 
     settings = get_settings()
     digest = telegram_id_hash(settings.app_secret, telegram_id)
-    with get_session() as session:
-        stmt = select(Invite).where(
+    async with unit_of_work(session) as session:
+        stmt = (
+            select(Invite)
+            .where(
+                and_(
+                    Invite.telegram_id_hash == digest,
+                    Invite.is_used.is_(False),
+                    Invite.expires_at > datetime.utcnow(),
+                )
+            )
+            .order_by(Invite.expires_at.desc())
+            .limit(1)
+        )
+        return (await session.execute(stmt)).scalars().first()
+
+
+async def mark_invite_used(
+    invite_link: str,
+    session: AsyncSession | None = None,
+) -> None:
+    async with unit_of_work(session) as session:
+        await session.execute(
+            update(Invite)
+            .where(Invite.invite_link == invite_link)
+            .values(is_used=True)
+        )
+
+
+async def purge_expired_invites(before: datetime, chunk_size: int) -> int:
+    # Chunked so a large backlog never holds one long write lock.
+    purged = 0
+    while True:
+        async with get_session() as session:
+            ids = list(
+                (
+                    await session.execute(
+                        select(Invite.id)
+                        .where(Invite.expires_at < before)
+                        .limit(chunk_size)
+                    )
+                ).scalars()
+            )
+            if not ids:
+                return purged
+            await session.execute(delete(Invite).where(Invite.id.in_(ids)))
+        purged += len(ids)
+
+
+async def add_pooled_invites(rows: list[dict]) -> None:
+    if not rows:
+        return
+    async with get_session() as session:
+        await session.execute(insert(PooledInvite), rows)
+
+
+async def count_pooled_invites(valid_after: datetime) -> int:
+    async with get_session() as session:
+        stmt = select(func.count(PooledInvite.id)).where(
+            PooledInvite.expires_at > valid_after
+        )
+        return (await session.execute(stmt)).scalar_one()
+
+
+async def delete_stale_pooled_invites(valid_after: datetime) -> int:
+    async with get_session() as session:
+        result = await session.execute(
+            delete(PooledInvite).where(PooledInvite.expires_at <= valid_after)
+        )
+        return result.rowcount
+
+
+async def claim_pooled_invite(
+    valid_after: datetime,
+    invite: Invite,
+    attempts: int = 3,
+) -> Invite | None:
+    # The soonest-expiring usable link is taken first. Deleting by id is
+    # the claim: if another worker got there first, try the next one. The
+    # invite is saved in the same transaction, so a failed save puts the
+    # link back instead of burning it.
+    async with get_session() as session:
+        for _ in range(attempts):
+            stmt = (
+                select(PooledInvite)
+                .where(PooledInvite.expires_at > valid_after)
+                .order_by(PooledInvite.expires_at)
+                .limit(1)
+            )
+            pooled = (await session.execute(stmt)).scalars().first()
+            if pooled is None:
+                return None
+            result = await session.execute(
+                delete(PooledInvite)
+                .where(PooledInvite.id == pooled.id)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount:
+                invite.invite_link = pooled.invite_link
+                invite.expires_at = pooled.expires_at
+                session.add(invite)
+                await session.flush()
+                return invite
+        return None
+
+
+async def list_active_users_page(
+    after_id: int,
+    limit: int,
+) -> list[tuple[int, str]]:
+    async with get_session() as session:
+        stmt = (
+            select(User.id, User.telegram_id)
+            .where(and_(User.id > after_id, User.is_active.is_(True)))
+            .order_by(User.id)
+            .limit(limit)
+        )
+        return [tuple(row) for row in await session.execute(stmt)]
+
+
+async def add_broadcast(broadcast: Broadcast) -> Broadcast:
+    async with get_session() as session:
+        session.add(broadcast)
+        await session.flush()
+        return broadcast
+
+
+async def get_broadcast(broadcast_id: int) -> Broadcast | None:
+    async with get_session() as session:
+        return await session.get(Broadcast, broadcast_id)
+
+
+async def list_broadcasts_by_status(status: str) -> list[Broadcast]:
+    async with get_session() as session:
+        stmt = (
+            select(Broadcast)
+            .where(Broadcast.status == status)
+            .order_by(Broadcast.id)
+        )
+        return list((await session.execute(stmt)).scalars().all())
+
+
+async def update_broadcast_progress(
+    broadcast_id: int,
+    last_user_id: int,
+    sent: int,
+    failed: int,
+    status: str | None = None,
+    finished_at: datetime | None = None,
+) -> None:
+    values = {"last_user_id": last_user_id, "sent": sent, "failed": failed}
+    if status is not None:
+        values["status"] = status
+    if finished_at is not None:
+        values["finished_at"] = finished_at
+    async with get_session() as session:
+        await session.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id)
+            .values(**values)
+        )
+
+
+async def get_stat_counters(names: Iterable[str]) -> dict[str, int]:
+    names = list(names)
+    async with get_session() as session:
+        stmt = select(StatCounter.name, StatCounter.value).where(
+            StatCounter.name.in_(names)
+        )
+        values = dict((await session.execute(stmt)).all())
+    return {name: values.get(name, 0) for name in names}
+
+
+async def reconcile_stat_counters(now: datetime) -> dict[str, int]:
+    # Recomputes every counter from the source tables in one transaction;
+    # run periodically to repair drift and to seed an existing database.
+    start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    async with get_session() as session:
+        values = {
+            STAT_USERS_TOTAL: await session.scalar(
+                select(func.count(User.id))
+            ),
+            STAT_SUBSCRIPTIONS_ACTIVE: await session.scalar(
+                select(func.count(User.id)).where(
+                    and_(
+                        User.is_active.is_(True),
+                        User.subscription_end.is_not(None),
+                    )
+                )
+            ),
+            _users_created_key(now): await session.scalar(
+                select(func.count(User.id)).where(
+                    User.created_at >= start_of_day
+                )
+            ),
+        }
+        revenue = await session.execute(
+            select(Payment.currency, func.sum(Payment.amount))
+            .where(Payment.status == "paid")
+            .group_by(Payment.currency)
+        )
+        for currency, total in revenue:
+            values[STAT_REVENUE_PREFIX + currency] = total
+        values = {name: int(value or 0) for name, value in values.items()}
+        stmt = _dialect_insert(session)(StatCounter)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[StatCounter.name],
+            set_={"value": stmt.excluded.value},
+        )
+        await session.execute(
+            stmt,
+            [{"name": name, "value": value} for name, value in values.items()],
+        )
+    return values
+
+
+async def get_media_file_id(key: str) -> str | None:
+    async with get_session() as session:
+        media = await session.get(MediaFile, key)
+        return media.file_id if media else None
+
+
+async def save_media_file_id(key: str, file_id: str) -> None:
+    async with get_session() as session:
+        stmt = _dialect_insert(session)(MediaFile).values(
+            key=key,
+            file_id=file_id,
+            updated_at=datetime.utcnow(),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[MediaFile.key],
+            set_={
+                "file_id": stmt.excluded.file_id,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+        await session.execute(stmt)
+
+
+async def delete_media_file_id(key: str) -> None:
+    async with get_session() as session:
+        await session.execute(delete(MediaFile).where(MediaFile.key == key))
+
+
+INBOX_PENDING = "pending"
+INBOX_PROCESSING = "processing"
+INBOX_DONE = "done"
+INBOX_FAILED = "failed"
+
+
+async def acquire_job_lease(
+    name: str,
+    owner: str,
+    now: datetime,
+    expires_at: datetime,
+) -> bool:
+    # Taking over an expired lease is a conditional UPDATE and a first-ever
+    # lease is an insert-or-ignore, so concurrent workers cannot both win.
+    async with get_session() as session:
+        result = await session.execute(
+            update(JobLease)
+            .where(
+                and_(
+                    JobLease.name == name,
+                    or_(JobLease.owner == owner, JobLease.expires_at <= now),
+                )
+            )
+            .values(owner=owner, expires_at=expires_at, acquired_at=now)
+        )
+        if result.rowcount:
+            return True
+        result = await session.execute(
+            _dialect_insert(session)(JobLease)
+            .values(
+                name=name,
+                owner=owner,
+                expires_at=expires_at,
+                acquired_at=now,
+            )
+            .on_conflict_do_nothing(index_elements=[JobLease.name])
+        )
+        return result.rowcount > 0
+
+
+async def extend_job_lease(
+    name: str,
+    owner: str,
+    expires_at: datetime,
+) -> bool:
+    async with get_session() as session:
+        result = await session.execute(
+            update(JobLease)
+            .where(and_(JobLease.name == name, JobLease.owner == owner))
+            .values(expires_at=expires_at)
+        )
+        return result.rowcount > 0
+
+
+async def get_job_runs() -> dict[str, datetime]:
+    async with get_session() as session:
+        rows = await session.execute(select(JobRun.name, JobRun.last_run_at))
+        return {name: last_run_at for name, last_run_at in rows}
+
+
+async def record_job_run(name: str, started_at: datetime) -> None:
+    async with get_session() as session:
+        stmt = _dialect_insert(session)(JobRun).values(
+            name=name,
+            last_run_at=started_at,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[JobRun.name],
+            set_={"last_run_at": stmt.excluded.last_run_at},
+        )
+        await session.execute(stmt)
+
+
+async def get_next_subscription_end(after: datetime) -> datetime | None:
+    # Served from the (is_active, subscription_end) index: one seek.
+    async with get_session() as session:
+        stmt = select(func.min(User.subscription_end)).where(
             and_(
-                Invite.telegram_id_hash == digest,
-                Invite.is_used.is_(False),
+                User.is_active.is_(True),
+                User.subscription_end > after,
             )
         )
-        return session.execute(stmt).scalars().first()
+        return (await session.execute(stmt)).scalar()
 
 
-def mark_invite_used(invite_link: str) -> None:
-    with get_session() as session:
-        stmt = select(Invite).where(Invite.invite_link == invite_link)
-        invite = session.execute(stmt).scalars().first()
-        if invite is None:
-            return
-        invite.is_used = True
-        session.add(invite)
+async def add_tinkoff_event(order_id: str, status: str, payload: str) -> bool:
+    # Insert-or-ignore on (order_id, status): redelivered notifications are
+    # acknowledged without creating a second unit of work.
+    now = datetime.utcnow()
+    async with get_session() as session:
+        stmt = (
+            _dialect_insert(session)(TinkoffEvent)
+            .values(
+                order_id=order_id,
+                status=status,
+                payload=payload,
+                state=INBOX_PENDING,
+                attempts=0,
+                next_attempt_at=now,
+                created_at=now,
+            )
+            .on_conflict_do_nothing(
+                index_elements=[TinkoffEvent.order_id, TinkoffEvent.status]
+            )
+        )
+        result = await session.execute(stmt)
+        return result.rowcount > 0
+
+
+async def claim_tinkoff_events(
+    now: datetime,
+    limit: int,
+) -> list[tuple[int, str, int]]:
+    async with get_session() as session:
+        stmt = (
+            select(
+                TinkoffEvent.id,
+                TinkoffEvent.payload,
+                TinkoffEvent.attempts,
+            )
+            .where(
+                and_(
+                    TinkoffEvent.state == INBOX_PENDING,
+                    TinkoffEvent.next_attempt_at <= now,
+                )
+            )
+            .order_by(TinkoffEvent.id)
+            .limit(limit)
+        )
+        candidates = list(await session.execute(stmt))
+        claimed = []
+        for event_id, payload, attempts in candidates:
+            result = await session.execute(
+                update(TinkoffEvent)
+                .where(
+                    and_(
+                        TinkoffEvent.id == event_id,
+                        TinkoffEvent.state == INBOX_PENDING,
+                    )
+                )
+                .values(
+                    state=INBOX_PROCESSING,
+                    attempts=attempts + 1,
+                    claimed_at=now,
+                )
+            )
+            if result.rowcount:
+                claimed.append((event_id, payload, attempts + 1))
+        return claimed
+
+
+async def finish_tinkoff_event(
+    event_id: int,
+    state: str,
+    error: str | None = None,
+    retry_at: datetime | None = None,
+) -> None:
+    values = {"state": state, "last_error": error}
+    if retry_at is not None:
+        values["next_attempt_at"] = retry_at
+    if state in (INBOX_DONE, INBOX_FAILED):
+        values["processed_at"] = datetime.utcnow()
+    async with get_session() as session:
+        await session.execute(
+            update(TinkoffEvent)
+            .where(TinkoffEvent.id == event_id)
+            .values(**values)
+        )
+
+
+async def requeue_stuck_tinkoff_events(claimed_before: datetime) -> int:
+    # Only rows claimed long ago: a recent claim may belong to another
+    # worker that is still processing it.
+    async with get_session() as session:
+        result = await session.execute(
+            update(TinkoffEvent)
+            .where(
+                and_(
+                    TinkoffEvent.state == INBOX_PROCESSING,
+                    or_(
+                        TinkoffEvent.claimed_at.is_(None),
+                        TinkoffEvent.claimed_at < claimed_before,
+                    ),
+                )
+            )
+            .values(state=INBOX_PENDING)
+        )
+        return result.rowcount
+
+
+async def get_tinkoff_inbox_stats() -> tuple[int, datetime | None]:
+    async with get_session() as session:
+        stmt = select(
+            func.count(TinkoffEvent.id),
+            func.min(TinkoffEvent.created_at),
+        ).where(TinkoffEvent.state == INBOX_PENDING)
+        depth, oldest = (await session.execute(stmt)).one()
+        return depth, oldest
+
+
+DB_CALL_SECONDS = histogram(
+    "db_call_seconds",
+    "Time spent in each repository function",
+    ("function", "outcome"),
+)
+
+
+def _timed(function):
+    name = function.__name__
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await function(*args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            DB_CALL_SECONDS.observe(
+                time.perf_counter() - started,
+                function=name,
+                outcome=outcome,
+            )
+
+    return wrapper
+
+
+def _instrument() -> None:
+    # Wraps every public coroutine defined here, so a new repository
+    # function is timed without remembering to decorate it. Session
+    # helpers and async generators are left alone.
+    namespace = globals()
+    for name, value in list(namespace.items()):
+        if (
+            not name.startswith("_")
+            and inspect.iscoroutinefunction(value)
+            and value.__module__ == __name__
+        ):
+            namespace[name] = _timed(value)
+
+
+_instrument()
@@ -1,16 +1,40 @@
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
-SessionLocal = sessionmaker(
-    autocommit=False,
+AsyncSessionLocal = async_sessionmaker(
     autoflush=False,
     expire_on_commit=False,
 )
 
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+}
+
+
+def to_async_url(database_url: str) -> str:
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    driver = ASYNC_DRIVERS.get(backend)
+    if driver is None or url.get_driver_name() == driver:
+        return database_url
+    return url.set(drivername="%s+%s" % (backend, driver)).render_as_string(
+        hide_password=False,
+    )
+
 
 def init_db(database_url: str) -> None:
-    engine = create_engine(database_url, future=True)
-    SessionLocal.configure(bind=engine)
-    from bot.db import models
+    async_engine = create_async_engine(to_async_url(database_url))
+    AsyncSessionLocal.configure(bind=async_engine)
+    from bot.db.migrations import check_revision
 
-    models.Base.metadata.create_all(bind=engine)
+    # Schema changes are applied by `python -m bot.db.migrations upgrade`;
+    # starting up only compares revision numbers. The sync engine exists
+    # for that one read and is disposed straight after; all queries go
+    # through the async sessions.
+    engine = create_engine(database_url, future=True)
+    try:
+        check_revision(engine)
+    finally:
+        engine.dispose()
@@ -1,6 +1,5 @@
 import json
-from datetime import datetime
-from aiogram import Router, F
+from aiogram import Bot, Router, F
 from aiogram.filters import Command
 from aiogram.types import (
     Message,
@@ -8,11 +7,10 @@ from aiogram.types import (
     InlineKeyboardButton,
     WebAppInfo
 )
-from sqlalchemy import func, select
 
 from bot.config import get_settings
-from bot.db.session import SessionLocal
-from bot.db.models import User, Payment
+from bot.services.broadcast import start_broadcast
+from bot.services.stats import get_admin_stats
 
 router = Router()
 
@@ -24,37 +22,13 @@ async def admin_panel_handler(message: Message):
         # Silently ignore non-admins or say unknown command
         return
 
-    # Fetch global stats
-    with SessionLocal() as session:
-        # Total Users
-        total_users = session.scalar(select(func.count(User.id))) or 0
-        
-        # Active Subs (future end date and active flag)
-        active_subs = session.scalar(
-            select(func.count(User.id)).where(
-                User.subscription_end > datetime.utcnow(),
-                User.is_active.is_(True)
-            )
-        ) or 0
-        
-        # Revenue (Sum of 'paid' XTR payments)
-        revenue = session.scalar(
-            select(func.sum(Payment.amount)).where(
-                Payment.currency == 'XTR',
-                Payment.status == 'paid'
-            )
-        ) or 0
-
-        # Users Today (Created since midnight UTC)
-        start_of_day = datetime.utcnow().replace(
-            hour=0,
-            minute=0,
-            second=0,
-            microsecond=0,
-        )
-        users_today = session.scalar(
-            select(func.count(User.id)).where(User.created_at >= start_of_day)
-        ) or 0
+    # Precomputed counters, maintained by the write paths and reconciled
+    # by the scheduler, so this stays O(1) as the tables grow.
+    stats = await get_admin_stats()
+    total_users = stats.total_users
+    active_subs = stats.active_subs
+    revenue = stats.revenue
+    users_today = stats.users_today
 
     # formatting 'today' string
     today_sign = "+" if users_today > 0 else ""
@@ -88,7 +62,7 @@ async def admin_panel_handler(message: Message):
 
 
 @router.message(F.web_app_data)
-async def web_app_data_handler(message: Message):
+async def web_app_data_handler(message: Message, bot: Bot):
     settings = get_settings()
     if message.from_user.id not in settings.admin_ids:
         return
@@ -100,13 +74,15 @@ async def web_app_data_handler(message: Message):
         if action == "broadcast":
             text = data.get("text")
             if text:
+                broadcast_id = await start_broadcast(
+                    bot,
+                    message.chat.id,
+                    text,
+                )
                 await message.answer(
-                    f"📢 <b>Broadcast Sent</b>\n\n{text}",
+                    f"📢 <b>Broadcast Queued</b> #{broadcast_id}\n\n{text}",
                     parse_mode="HTML"
                 )
-                # TODO: Implement actual broadcast logic here using DB users
-                # e.g., iterate users and send.
-                # For now, just confirming receipt.
 
     except json.JSONDecodeError:
         await message.answer("Invalid data received from WebApp.")
@@ -2,7 +2,7 @@ from aiogram import Bot, F, Router
 from aiogram.filters import Command
 from aiogram.types import Message
 
-from bot.services.invites import issue_invite_link
+from bot.middlewares.pacing import PRIORITY_PAYMENT, api_priority
 from bot.services.payments import (
     build_stars_invoice,
     handle_successful_payment,
@@ -29,28 +29,29 @@ async def buy_3_months(message: Message, bot: Bot) -> None:
 
 @router.message(F.successful_payment)
 async def successful_payment(message: Message, bot: Bot) -> None:
+    with api_priority(PRIORITY_PAYMENT):
+        await _confirm_payment(message, bot)
+
+
+async def _confirm_payment(message: Message, bot: Bot) -> None:
     payment = message.successful_payment
-    tariff = handle_successful_payment(
+    result = await handle_successful_payment(
+        bot,
         telegram_id=message.from_user.id,
         username=message.from_user.username,
         payload=payment.invoice_payload,
         total_amount=payment.total_amount,
+        charge_id=payment.telegram_payment_charge_id,
     )
-    try:
-        invite = await issue_invite_link(
-            bot,
-            message.from_user.id,
-            message.from_user.username,
-        )
-    except ValueError:
-        invite = None
-    if invite:
+    if result.duplicate:
+        return
+    if result.invite_link:
         await message.answer(
             (
                 "Оплата принята. Доступ активирован на %s месяцев. "
                 "Вот твой инвайт:\n%s"
             )
-            % (tariff.months, invite)
+            % (result.tariff.months, result.invite_link)
         )
     else:
         await message.answer(
@@ -58,5 +59,5 @@ async def successful_payment(message: Message, bot: Bot) -> None:
                 "Оплата принята. Доступ активирован на %s месяцев. "
                 "Инвайт будет выдан через /access."
             )
-            % tariff.months
+            % result.tariff.months
         )
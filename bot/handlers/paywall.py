@@ -1,9 +1,9 @@
 from pathlib import Path
 
 from aiogram import Bot, F, Router
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
-from aiogram.types import CallbackQuery, Message
-from aiogram.types.input_file import FSInputFile
+from aiogram.types import CallbackQuery, InputMediaPhoto, Message
 
 from bot.keyboards.paywall import (
     entry_keyboard,
@@ -14,16 +14,14 @@ from bot.keyboards.paywall import (
 from bot.config import get_settings
 from bot.services.copy import entry_text, offer_text, pricing_text, warmup_text
 from bot.services.invites import issue_invite_link
+from bot.services.media import send_cached_photo
 from bot.services.payments import build_stars_invoice
 from bot.services.subscriptions import grant_subscription
 from bot.services.tariffs import get_tariff
 
 router = Router()
 PHOTO_PATH = Path(__file__).resolve().parents[2] / "start.jpg"
-
-
-def _photo() -> FSInputFile:
-    return FSInputFile(PHOTO_PATH)
+PHOTO_KEY = "paywall:start.jpg"
 
 
 async def _send_photo_message(
@@ -31,10 +29,14 @@ async def _send_photo_message(
     text: str,
     keyboard,
 ) -> None:
-    await message.answer_photo(
-        _photo(),
-        caption=text,
-        reply_markup=keyboard,
+    await send_cached_photo(
+        PHOTO_KEY,
+        PHOTO_PATH,
+        lambda photo: message.answer_photo(
+            photo,
+            caption=text,
+            reply_markup=keyboard,
+        ),
     )
 
 
@@ -47,37 +49,50 @@ async def start_paywall(message: Message) -> None:
     )
 
 
+async def _switch_screen(
+    callback: CallbackQuery,
+    text: str,
+    keyboard,
+) -> None:
+    # Every screen shares the same photo, so moving through the funnel only
+    # needs the caption and keyboard swapped on the message already shown.
+    await callback.answer()
+    message = callback.message
+    if not isinstance(message, Message):
+        # Inaccessible (too old) messages cannot be edited.
+        await _send_photo_message(message, text, keyboard)
+        return
+    try:
+        if message.photo:
+            await message.edit_caption(caption=text, reply_markup=keyboard)
+        else:
+            await send_cached_photo(
+                PHOTO_KEY,
+                PHOTO_PATH,
+                lambda photo: message.edit_media(
+                    InputMediaPhoto(media=photo, caption=text),
+                    reply_markup=keyboard,
+                ),
+            )
+    except TelegramBadRequest as exc:
+        if "message is not modified" in exc.message:
+            return
+        await _send_photo_message(message, text, keyboard)
+
+
 @router.callback_query(F.data == "pw:warmup")
 async def show_warmup(callback: CallbackQuery) -> None:
-    await callback.message.delete()
-    await _send_photo_message(
-        callback.message,
-        warmup_text(),
-        warmup_keyboard(),
-    )
-    await callback.answer()
+    await _switch_screen(callback, warmup_text(), warmup_keyboard())
 
 
 @router.callback_query(F.data == "pw:offer")
 async def show_offer(callback: CallbackQuery) -> None:
-    await callback.message.delete()
-    await _send_photo_message(
-        callback.message,
-        offer_text(),
-        offer_keyboard(),
-    )
-    await callback.answer()
+    await _switch_screen(callback, offer_text(), offer_keyboard())
 
 
 @router.callback_query(F.data == "pw:pricing")
 async def show_pricing(callback: CallbackQuery) -> None:
-    await callback.message.delete()
-    await _send_photo_message(
-        callback.message,
-        pricing_text(),
-        pricing_keyboard(),
-    )
-    await callback.answer()
+    await _switch_screen(callback, pricing_text(), pricing_keyboard())
 
 
 @router.callback_query(F.data.startswith("buy:"))
@@ -86,7 +101,7 @@ async def buy_tariff(callback: CallbackQuery, bot: Bot) -> None:
     tariff = get_tariff(tariff_code)
     settings = get_settings()
     if callback.from_user.id in settings.admin_ids:
-        grant_subscription(
+        await grant_subscription(
             callback.from_user.id,
             callback.from_user.username,
             tariff.code,
@@ -2,6 +2,8 @@ import asyncio
 import logging
 
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiohttp import web
 
 from bot.config import get_settings
 from bot.db.session import init_db
@@ -10,31 +12,92 @@ from bot.handlers.admin import router as admin_router
 from bot.handlers.payments import router as payments_router
 from bot.handlers.paywall import router as paywall_router
 from bot.handlers.system import router as system_router
-from bot.scheduler.jobs import start_scheduler
+from bot.metrics import CONTENT_TYPE, REGISTRY
+from bot.middlewares.metrics import ApiMetrics, HandlerMetrics
+from bot.middlewares.pacing import OutboundPacer
+from bot.middlewares.throttling import ThrottlingMiddleware
+from bot.scheduler.jobs import expiry_watcher, start_scheduler
+from bot.services.audit import audit_sink
+from bot.services.broadcast import resume_broadcasts
+from bot.services.invite_pool import invite_pool
 
 logging.basicConfig(level=logging.INFO)
 
 
 def build_bot() -> Bot:
+    # One long-lived Bot per process: its aiohttp session keeps a pooled
+    # connector, so API calls reuse warm TLS connections, and its pacer is
+    # the single place outbound calls are rate limited.
     settings = get_settings()
-    return Bot(token=settings.bot_token)
+    session = AiohttpSession(limit=settings.bot_connection_limit)
+    session.middleware(OutboundPacer())
+    session.middleware(ApiMetrics())
+    return Bot(token=settings.bot_token, session=session)
 
 
-async def main() -> None:
-    settings = get_settings()
-    init_db(settings.database_url)
-
-    bot = build_bot()
+def build_dispatcher() -> Dispatcher:
     dp = Dispatcher()
+    throttling = ThrottlingMiddleware(
+        exempt_user_ids=frozenset(get_settings().admin_ids),
+    )
+    dp.message.outer_middleware(throttling)
+    dp.callback_query.outer_middleware(throttling)
+    handler_metrics = HandlerMetrics()
+    dp.message.middleware(handler_metrics)
+    dp.callback_query.middleware(handler_metrics)
+    dp.chat_member.middleware(handler_metrics)
     dp.include_router(admin_router)
     dp.include_router(system_router)
     dp.include_router(paywall_router)
     dp.include_router(payments_router)
     dp.include_router(access_router)
+    return dp
+
+
+async def start_metrics_server(port: int) -> web.AppRunner:
+    # Polling mode has no web app, so the bot serves /metrics itself.
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(
+            body=REGISTRY.render().encode(),
+            headers={"Content-Type": CONTENT_TYPE},
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, port=port).start()
+    return runner
+
+
+async def main() -> None:
+    settings = get_settings()
+    init_db(settings.database_url)
+    metrics_runner = None
+    if settings.metrics_port:
+        metrics_runner = await start_metrics_server(settings.metrics_port)
+
+    bot = build_bot()
+    dp = build_dispatcher()
 
-    start_scheduler(bot)
+    await audit_sink.start()
+    await invite_pool.start(bot)
+    scheduler = await start_scheduler(bot)
+    await resume_broadcasts(bot)
 
-    await dp.start_polling(bot)
+    await bot.delete_webhook()
+    try:
+        await dp.start_polling(
+            bot,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+    finally:
+        scheduler.shutdown(wait=False)
+        await expiry_watcher.stop()
+        await invite_pool.stop()
+        await audit_sink.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 
 if __name__ == "__main__":
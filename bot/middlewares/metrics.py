@@ -0,0 +1,72 @@
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.methods import Response, TelegramMethod
+from aiogram.types import TelegramObject
+
+from bot.metrics import histogram
+
+HANDLER_SECONDS = histogram(
+    "bot_handler_seconds",
+    "Update handler latency",
+    ("router", "handler", "outcome"),
+)
+API_SECONDS = histogram(
+    "telegram_api_seconds",
+    "Bot API call latency, excluding time spent waiting for pacing",
+    ("method", "outcome"),
+)
+
+
+class HandlerMetrics(BaseMiddleware):
+    # Registered as an inner middleware on the Dispatcher, which nested
+    # routers inherit, so it runs once per handled update.
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        callback = data["handler"].callback
+        router = callback.__module__.rsplit(".", 1)[-1]
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await handler(event, data)
+            outcome = "ok"
+            return result
+        finally:
+            HANDLER_SECONDS.observe(
+                time.perf_counter() - started,
+                router=router,
+                handler=callback.__name__,
+                outcome=outcome,
+            )
+
+
+class ApiMetrics(BaseRequestMiddleware):
+    # Installed after OutboundPacer, so it wraps only the HTTP call itself.
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Response:
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            return await make_request(bot, method)
+        except Exception as exc:
+            outcome = type(exc).__name__
+            raise
+        finally:
+            API_SECONDS.observe(
+                time.perf_counter() - started,
+                method=method.__api_method__,
+                outcome=outcome,
+            )
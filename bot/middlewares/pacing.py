@@ -0,0 +1,159 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+
+from bot.metrics import counter, gauge, histogram
+from bot.services.ratelimit import KeyedTokenBuckets, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Lower value is served first when the global budget is contended.
+PRIORITY_PAYMENT = 0
+PRIORITY_INVITE = 1
+PRIORITY_INTERACTIVE = 2
+PRIORITY_BULK = 3
+PRIORITY_NAMES = {
+    PRIORITY_PAYMENT: "payment",
+    PRIORITY_INVITE: "invite",
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_BULK: "bulk",
+}
+
+# Telegram allows roughly 30 messages per second overall, one per second to
+# a private chat and 20 per minute to a group or channel.
+GLOBAL_RATE = 30.0
+PRIVATE_CHAT_RATE = 1.0
+GROUP_CHAT_RATE = 20 / 60
+MAX_RETRY_AFTER_ATTEMPTS = 3
+
+QUEUE_DEPTH = gauge(
+    "telegram_outbound_queue_depth",
+    "Bot API calls waiting for the global send budget",
+    ("priority",),
+)
+WAIT_SECONDS = histogram(
+    "telegram_outbound_wait_seconds",
+    "Time a Bot API call waited for pacing before being sent",
+    ("priority",),
+)
+RETRY_AFTER = counter(
+    "telegram_retry_after_total",
+    "Flood-control responses received from the Bot API",
+    ("method",),
+)
+
+_priority: ContextVar[int] = ContextVar(
+    "api_priority",
+    default=PRIORITY_INTERACTIVE,
+)
+
+
+@contextmanager
+def api_priority(priority: int) -> Iterator[None]:
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def _is_message_call(method: TelegramMethod) -> bool:
+    name = method.__api_method__
+    return name.startswith(("send", "edit", "copy", "forward"))
+
+
+class OutboundPacer(BaseRequestMiddleware):
+    # Only calls addressed to a chat are paced; callback answers, getMe and
+    # the like go straight through.
+    def __init__(
+        self,
+        global_rate: float = GLOBAL_RATE,
+        private_chat_rate: float = PRIVATE_CHAT_RATE,
+        group_chat_rate: float = GROUP_CHAT_RATE,
+    ) -> None:
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_buckets = KeyedTokenBuckets(private_chat_rate, 1)
+        self.group_buckets = KeyedTokenBuckets(group_chat_rate, 3)
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._pump: asyncio.Task | None = None
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        if isinstance(chat_id, int) and chat_id > 0:
+            return self.private_buckets.get(chat_id)
+        return self.group_buckets.get(chat_id)
+
+    async def _acquire_global(self, priority: int) -> None:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._waiters,
+            (priority, next(self._sequence), future),
+        )
+        QUEUE_DEPTH.inc(priority=PRIORITY_NAMES[priority])
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._release_waiters())
+        try:
+            await future
+        finally:
+            QUEUE_DEPTH.dec(priority=PRIORITY_NAMES[priority])
+
+    async def _release_waiters(self) -> None:
+        # Tokens go to the most urgent waiter at the moment one is
+        # available, so bulk traffic never delays a payment confirmation
+        # by more than one token.
+        while self._waiters:
+            wait = self.global_bucket.delay()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.cancelled():
+                continue
+            self.global_bucket.try_acquire()
+            future.set_result(None)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Response:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        priority = _priority.get()
+        label = PRIORITY_NAMES[priority]
+        chat_bucket = self._chat_bucket(chat_id)
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            if _is_message_call(method):
+                await chat_bucket.acquire()
+            await self._acquire_global(priority)
+            WAIT_SECONDS.observe(time.perf_counter() - started, priority=label)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as exc:
+                # Flood control applies to the whole bot: hold every queue
+                # for the requested time, then retry this call.
+                RETRY_AFTER.inc(method=method.__api_method__)
+                logger.warning("Flood control, pausing %ss", exc.retry_after)
+                self.global_bucket.pause(exc.retry_after)
+                chat_bucket.pause(exc.retry_after)
+                attempt += 1
+                if attempt > MAX_RETRY_AFTER_ATTEMPTS:
+                    raise
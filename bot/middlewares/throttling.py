@@ -0,0 +1,116 @@
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from bot.metrics import counter
+from bot.services.ratelimit import KeyedTokenBuckets
+
+logger = logging.getLogger(__name__)
+
+THROTTLED = counter(
+    "throttled_updates_total",
+    "Updates dropped by the per-user rate limiter",
+    ("action",),
+)
+
+
+@dataclass(frozen=True)
+class ThrottlePolicy:
+    rate: float
+    burst: float
+    # Charged against the user's shared budget, so expensive actions (new
+    # invite links, invoices) use it up faster than screen switches.
+    cost: float = 1.0
+
+
+DEFAULT_ACTION = "default"
+DEFAULT_POLICIES = {
+    "access": ThrottlePolicy(rate=1 / 30, burst=2, cost=5),
+    "buy": ThrottlePolicy(rate=1 / 5, burst=2, cost=3),
+    "start": ThrottlePolicy(rate=1 / 5, burst=3),
+    "pw": ThrottlePolicy(rate=1, burst=4),
+    DEFAULT_ACTION: ThrottlePolicy(rate=1, burst=5),
+}
+USER_BUDGET_RATE = 1.0
+USER_BUDGET_BURST = 10.0
+MAX_WARNED = 10_000
+
+
+def _action(event: TelegramObject) -> str | None:
+    # None means the update is never throttled.
+    if isinstance(event, CallbackQuery):
+        return (event.data or "").split(":", 1)[0]
+    if isinstance(event, Message):
+        if event.successful_payment or event.web_app_data:
+            return None
+        text = event.text or ""
+        if text.startswith("/"):
+            return text[1:].split(maxsplit=1)[0].split("@", 1)[0].lower()
+    return DEFAULT_ACTION
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    # Registered as an outer middleware, so excess updates are dropped
+    # before filters, handlers, the database or the Bot API see them.
+    def __init__(
+        self,
+        policies: dict[str, ThrottlePolicy] | None = None,
+        exempt_user_ids: frozenset[int] = frozenset(),
+    ) -> None:
+        self.policies = dict(policies or DEFAULT_POLICIES)
+        self.exempt_user_ids = exempt_user_ids
+        self.budgets = KeyedTokenBuckets(USER_BUDGET_RATE, USER_BUDGET_BURST)
+        self._actions = {
+            name: KeyedTokenBuckets(policy.rate, policy.burst)
+            for name, policy in self.policies.items()
+        }
+        self._warned: set[tuple[int, str]] = set()
+
+    def allow(self, user_id: int, action: str) -> bool:
+        if action not in self.policies:
+            action = DEFAULT_ACTION
+        policy = self.policies[action]
+        bucket = self._actions[action].get(user_id)
+        budget = self.budgets.get(user_id)
+        if bucket.delay() > 0 or budget.delay(policy.cost) > 0:
+            return False
+        bucket.try_acquire()
+        budget.try_acquire(policy.cost)
+        return True
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        action = _action(event)
+        if (
+            user is None
+            or action is None
+            or user.id in self.exempt_user_ids
+        ):
+            return await handler(event, data)
+
+        key = (user.id, action)
+        if self.allow(user.id, action):
+            self._warned.discard(key)
+            return await handler(event, data)
+
+        THROTTLED.inc(action=action if action in self.policies else "other")
+        # Only the first rejection in a burst gets an answer; the rest are
+        # dropped silently so a flood costs no API calls.
+        if isinstance(event, CallbackQuery) and key not in self._warned:
+            if len(self._warned) >= MAX_WARNED:
+                self._warned.clear()
+            self._warned.add(key)
+            try:
+                await event.answer("Слишком часто, подожди немного.")
+            except TelegramAPIError:
+                pass
+        return None
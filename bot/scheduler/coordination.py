@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import os
+import socket
+import string
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, TypeVar
+
+from bot.db.repository import acquire_job_lease, extend_job_lease
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+LEASE_TTL = timedelta(seconds=60)
+HEARTBEAT_SECONDS = LEASE_TTL.total_seconds() / 3
+
+WORKER_ID = "%s:%s:%s" % (
+    socket.gethostname(),
+    os.getpid(),
+    uuid.uuid4().hex[:8],
+)
+
+# urlsafe base64 alphabet of telegram_id_hash, used to split users into
+# shards by the first character of their hash.
+HASH_ALPHABET = string.ascii_letters + string.digits + "-_"
+
+
+class LeaseLost(Exception):
+    pass
+
+
+async def run_leased(
+    name: str,
+    cooldown: timedelta,
+    job: Callable[..., Awaitable[T]],
+    *args: object,
+) -> T | None:
+    # Runs ``job`` only if this worker wins the lease, returning None when
+    # another worker holds it. The job runs in its own task, renewed in the
+    # background; losing the lease cancels that task only, never the
+    # caller, and surfaces as LeaseLost. On exit the lease stays reserved
+    # until ``cooldown`` after the start, so other workers firing the same
+    # tick a little later skip it.
+    started = datetime.utcnow()
+    acquired = await acquire_job_lease(
+        name,
+        WORKER_ID,
+        started,
+        started + LEASE_TTL,
+    )
+    if not acquired:
+        return None
+    body = asyncio.create_task(job(*args))
+    heartbeat = asyncio.create_task(_heartbeat(name, body))
+    try:
+        # wait() does not propagate the body's cancellation, so a lost
+        # lease is told apart from the caller being cancelled.
+        await asyncio.wait({body})
+    except asyncio.CancelledError:
+        body.cancel()
+        await asyncio.gather(body, return_exceptions=True)
+        raise
+    finally:
+        heartbeat.cancel()
+        await asyncio.gather(heartbeat, return_exceptions=True)
+        await extend_job_lease(
+            name,
+            WORKER_ID,
+            max(datetime.utcnow(), started + cooldown),
+        )
+    if body.cancelled():
+        raise LeaseLost(name)
+    return body.result()
+
+
+async def _heartbeat(name: str, body: asyncio.Task) -> None:
+    while True:
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        try:
+            renewed = await extend_job_lease(
+                name,
+                WORKER_ID,
+                datetime.utcnow() + LEASE_TTL,
+            )
+        except Exception:
+            logger.exception("Lease %s heartbeat failed", name)
+            continue
+        if not renewed:
+            # Another worker took over; stop rather than run the job twice.
+            logger.error("Lease %s lost, cancelling the job", name)
+            body.cancel()
+            return
+
+
+def shard_prefixes(shard: int, shards: int) -> tuple[str, ...] | None:
+    if shards <= 1:
+        return None
+    size, extra = divmod(len(HASH_ALPHABET), shards)
+    start = shard * size + min(shard, extra)
+    end = start + size + (1 if shard < extra else 0)
+    return tuple(HASH_ALPHABET[start:end])
@@ -1,82 +1,360 @@
-from datetime import datetime
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
 
 from aiogram import Bot
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from bot.config import get_settings
 from bot.db.repository import (
-    list_expired_users,
-    list_users_for_reminder,
-    update_user_status,
+    add_reminder_logs,
+    deactivate_users,
+    delete_reminder_logs,
+    get_job_runs,
+    get_next_subscription_end,
+    iter_expired_users,
+    list_pending_reminders,
+    purge_expired_invites,
+    reconcile_stat_counters,
+    record_job_run,
 )
-from bot.security.crypto import decrypt_text
-from bot.services.subscriptions import (
-    REMINDER_DAYS,
-    log_security_action,
-    reminder_window,
+from bot.metrics import counter, histogram
+from bot.middlewares.pacing import PRIORITY_BULK, api_priority
+from bot.scheduler.coordination import (
+    LeaseLost,
+    run_leased,
+    shard_prefixes,
 )
+from bot.services.delivery import sender
+from bot.services.retention import compact_security_logs
+from bot.services.subscriptions import REMINDER_DAYS, log_security_actions
+from bot.services.users import decrypt_telegram_ids
 
+logger = logging.getLogger(__name__)
 
-async def run_expiration_job(bot: Bot) -> None:
-    settings = get_settings()
-    expired_users = list_expired_users(datetime.utcnow())
-    for user in expired_users:
-        try:
-            telegram_id = int(
-                decrypt_text(settings.fernet_key, user.telegram_id)
-            )
-        except Exception:
-            log_security_action(None, "decrypt_failed", "user_id=%s" % user.id)
-            continue
+EXPIRATION_CHUNK_SIZE = 500
+INVITE_PURGE_CHUNK_SIZE = 1000
+# Expired links are kept a while so late chat_member updates still match.
+INVITE_PURGE_GRACE = timedelta(days=1)
+# A finished tick keeps its lease this long, so workers whose timers fire
+# slightly later do not repeat it.
+EXPIRATION_COOLDOWN = timedelta(minutes=1)
+REMINDER_COOLDOWN = timedelta(hours=12)
+HOURLY_COOLDOWN = timedelta(minutes=30)
+DAILY_COOLDOWN = timedelta(hours=12)
+EXPIRY_MAX_SLEEP = timedelta(minutes=30)
+EXPIRY_SLACK = timedelta(seconds=1)
+BAN_CONCURRENCY = 10
+REMINDER_CONCURRENCY = 8
+
+JOB_SECONDS = histogram(
+    "scheduler_job_seconds",
+    "Duration of one scheduler job run",
+    ("job",),
+    buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0),
+)
+JOB_ROWS = counter(
+    "scheduler_job_rows_total",
+    "Rows processed by scheduler jobs",
+    ("job",),
+)
+
+_expiration_lock = asyncio.Lock()
+
+
+async def _ban(
+    bot: Bot,
+    chat_id: int,
+    telegram_id: int,
+    semaphore: asyncio.Semaphore,
+) -> bool:
+    async with semaphore:
         try:
-            await bot.ban_chat_member(settings.admin_channel_id, telegram_id)
+            with api_priority(PRIORITY_BULK):
+                await bot.ban_chat_member(chat_id, telegram_id)
         except Exception:
-            log_security_action(
-                telegram_id,
-                "kick_failed",
-                "channel_id=%s" % settings.admin_channel_id,
-            )
-        update_user_status(user.id, False)
-        log_security_action(telegram_id, "subscription_expired_kick", None)
+            return False
+    return True
 
 
-async def run_reminder_job(bot: Bot) -> None:
-    settings = get_settings()
-    for days in REMINDER_DAYS:
-        window_start, window_end = reminder_window(days)
-        users = list_users_for_reminder(window_start, window_end)
-        for user in users:
+def _shards() -> list[tuple[str, tuple[str, ...] | None]]:
+    shards = get_settings().scheduler_shards
+    return [
+        ("%s/%s" % (shard, shards), shard_prefixes(shard, shards))
+        for shard in range(shards)
+    ]
+
+
+async def run_expiration_job(bot: Bot) -> int:
+    if _expiration_lock.locked():
+        logger.warning("Expiration sweep still running, skipping this tick")
+        return 0
+    # Every worker runs this tick; each shard is swept by whichever worker
+    # wins its lease, so workers split the shards between them.
+    expired = 0
+    async with _expiration_lock:
+        for shard, prefixes in _shards():
             try:
-                telegram_id = int(
-                    decrypt_text(settings.fernet_key, user.telegram_id)
+                expired += await run_leased(
+                    "expiration:%s" % shard,
+                    EXPIRATION_COOLDOWN,
+                    _sweep_expired,
+                    bot,
+                    prefixes,
+                ) or 0
+            except LeaseLost:
+                # The new holder finishes this shard; carry on with the rest.
+                continue
+    return expired
+
+
+async def _sweep_expired(
+    bot: Bot,
+    hash_prefixes: tuple[str, ...] | None = None,
+) -> int:
+    settings = get_settings()
+    channel_id = settings.admin_channel_id
+    now = datetime.utcnow()
+    semaphore = asyncio.Semaphore(BAN_CONCURRENCY)
+    expired = 0
+    async for rows in iter_expired_users(
+        now,
+        EXPIRATION_CHUNK_SIZE,
+        hash_prefixes,
+    ):
+        telegram_ids = decrypt_telegram_ids(
+            [encrypted_id for _, encrypted_id, _ in rows]
+        )
+        logs = []
+        targets = []
+        for (user_id, _, digest), telegram_id in zip(rows, telegram_ids):
+            if telegram_id is None:
+                logs.append((None, "decrypt_failed", "user_id=%s" % user_id))
+            else:
+                targets.append((user_id, digest, telegram_id))
+
+        banned = await asyncio.gather(
+            *(
+                _ban(bot, channel_id, telegram_id, semaphore)
+                for _, _, telegram_id in targets
+            )
+        )
+        for (_, _, telegram_id), ok in zip(targets, banned):
+            if not ok:
+                logs.append(
+                    (telegram_id, "kick_failed", "channel_id=%s" % channel_id)
                 )
-            except Exception:
-                log_security_action(
-                    None,
-                    "decrypt_failed",
-                    "user_id=%s" % user.id,
+            logs.append((telegram_id, "subscription_expired_kick", None))
+
+        await deactivate_users(
+            [(user_id, digest) for user_id, digest, _ in targets],
+            now,
+        )
+        await log_security_actions(logs)
+        expired += len(targets)
+    return expired
+
+
+async def run_reminder_job(bot: Bot) -> int:
+    sent = 0
+    for shard, prefixes in _shards():
+        try:
+            sent += await run_leased(
+                "reminders:%s" % shard,
+                REMINDER_COOLDOWN,
+                _send_reminders,
+                bot,
+                prefixes,
+            ) or 0
+        except LeaseLost:
+            continue
+    return sent
+
+
+async def _send_reminders(
+    bot: Bot,
+    hash_prefixes: tuple[str, ...] | None = None,
+) -> int:
+    pending = await list_pending_reminders(
+        datetime.utcnow(),
+        REMINDER_DAYS,
+        hash_prefixes,
+    )
+    telegram_ids = decrypt_telegram_ids(
+        [encrypted_id for _, encrypted_id, _, _ in pending]
+    )
+    logs = []
+    claims = []
+    messages = []
+    for (user_id, _, subscription_end, days), telegram_id in zip(
+        pending,
+        telegram_ids,
+    ):
+        if telegram_id is None:
+            logs.append((None, "decrypt_failed", "user_id=%s" % user_id))
+            continue
+        claims.append(
+            {
+                "user_id": user_id,
+                "days": days,
+                "subscription_end": subscription_end,
+            }
+        )
+        messages.append(
+            (
+                telegram_id,
+                (
+                    "Напоминание: доступ закончится через %s дней. "
+                    "Нажми, чтобы продлить."
                 )
-                continue
+                % days,
+            )
+        )
+
+    # Claimed before sending: a crash mid-run can drop a reminder but a
+    # rerun never repeats one. Claims for failed sends are released so the
+    # next run retries them while the window is still open.
+    await add_reminder_logs(claims)
+    results = await sender.send_many(
+        bot,
+        messages,
+        concurrency=REMINDER_CONCURRENCY,
+    )
+    failed = []
+    for claim, (telegram_id, _), ok in zip(claims, messages, results):
+        if not ok:
+            failed.append(claim)
+            meta = "days=%s" % claim["days"]
+            logs.append((telegram_id, "reminder_send_failed", meta))
+    await delete_reminder_logs(failed)
+    await log_security_actions(logs)
+    return len(claims) - len(failed)
+
+
+async def run_stats_reconcile_job() -> int:
+    counters = await run_leased(
+        "stats_reconcile",
+        HOURLY_COOLDOWN,
+        reconcile_stat_counters,
+        datetime.utcnow(),
+    )
+    return len(counters or ())
+
+
+async def run_invite_purge_job() -> int:
+    purged = await run_leased(
+        "invite_purge",
+        HOURLY_COOLDOWN,
+        purge_expired_invites,
+        datetime.utcnow() - INVITE_PURGE_GRACE,
+        INVITE_PURGE_CHUNK_SIZE,
+    )
+    if purged:
+        logger.info("Purged %s expired invites", purged)
+    return purged or 0
+
+
+async def run_security_log_compaction_job() -> int:
+    archived = await run_leased(
+        "security_log_compaction",
+        DAILY_COOLDOWN,
+        compact_security_logs,
+        datetime.utcnow(),
+    )
+    return archived or 0
+
+
+class ExpiryWatcher:
+    # Sleeps until the next subscription_end instead of polling, so kicks
+    # happen close to the expiry time. The sleep is capped, which also
+    # bounds the delay for subscriptions shortened after it started.
+    def __init__(self) -> None:
+        self._task: asyncio.Task | None = None
+
+    def start(self, bot: Bot) -> None:
+        self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _run(self, bot: Bot) -> None:
+        while True:
+            delay = EXPIRY_MAX_SLEEP
             try:
-                await bot.send_message(
-                    telegram_id,
-                    (
-                        "Напоминание: доступ закончится через %s дней. "
-                        "Нажми, чтобы продлить."
+                swept_until = datetime.utcnow()
+                await _timed_job("expiration", run_expiration_job, bot)
+                due = await get_next_subscription_end(swept_until)
+                if due is not None:
+                    delay = min(
+                        delay,
+                        max(due - datetime.utcnow(), timedelta(0))
+                        + EXPIRY_SLACK,
                     )
-                    % days,
-                )
             except Exception:
-                log_security_action(
-                    telegram_id,
-                    "reminder_send_failed",
-                    "days=%s" % days,
-                )
+                logger.exception("Expiry watcher iteration failed")
+            await asyncio.sleep(delay.total_seconds())
+
+
+expiry_watcher = ExpiryWatcher()
+
+
+async def _timed_job(
+    name: str,
+    job: Callable[..., Awaitable[int]],
+    *args: object,
+) -> int:
+    with JOB_SECONDS.time(job=name):
+        rows = await job(*args)
+    JOB_ROWS.inc(rows, job=name)
+    return rows
+
+
+async def _run_and_record(
+    name: str,
+    job: Callable[..., Awaitable[int]],
+    *args: object,
+) -> None:
+    started = datetime.utcnow()
+    await _timed_job(name, job, *args)
+    await record_job_run(name, started)
 
 
-def start_scheduler(bot: Bot) -> AsyncIOScheduler:
+async def start_scheduler(bot: Bot) -> AsyncIOScheduler:
+    # Each job's last run is kept in job_runs, so a restart resumes the
+    # schedule where it was instead of resetting the interval, and a run
+    # missed while the process was down is made up straight away.
+    runs = await get_job_runs()
+    now = datetime.utcnow()
     scheduler = AsyncIOScheduler(timezone="UTC")
-    scheduler.add_job(run_expiration_job, "interval", minutes=30, args=[bot])
-    scheduler.add_job(run_reminder_job, "interval", hours=24, args=[bot])
+    jobs = [
+        ("reminders", run_reminder_job, timedelta(hours=24), [bot]),
+        ("stats_reconcile", run_stats_reconcile_job, timedelta(hours=1), []),
+        ("invite_purge", run_invite_purge_job, timedelta(hours=1), []),
+        (
+            "security_log_compaction",
+            run_security_log_compaction_job,
+            timedelta(hours=24),
+            [],
+        ),
+    ]
+    for name, job, interval, args in jobs:
+        last_run = runs.get(name)
+        next_run = now if last_run is None else max(now, last_run + interval)
+        scheduler.add_job(
+            _run_and_record,
+            "interval",
+            seconds=interval.total_seconds(),
+            next_run_time=next_run,
+            args=[name, job, *args],
+            id=name,
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=None,
+        )
     scheduler.start()
+    expiry_watcher.start(bot)
     return scheduler
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Iterable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.config import get_settings
+from bot.db.repository import add_security_logs
+from bot.metrics import counter, gauge, histogram
+from bot.security.crypto import encrypt_many, hash_many
+
+logger = logging.getLogger(__name__)
+
+AUDIT_BATCH_SIZE = 200
+AUDIT_FLUSH_INTERVAL = 1.0
+AUDIT_MAX_PENDING = 10_000
+AUDIT_MAX_ATTEMPTS = 3
+
+AuditEntry = tuple[int | None, str, str | None]
+# An entry stamped with the time it was logged, not the time it is written.
+AuditRecord = tuple[datetime, int | None, str, str | None]
+
+AUDIT_PENDING = gauge(
+    "audit_pending",
+    "Security log records buffered and not yet written",
+)
+AUDIT_RECORDS = counter(
+    "audit_records_total",
+    "Security log records by write outcome",
+    ("outcome",),
+)
+AUDIT_FLUSH_SECONDS = histogram(
+    "audit_flush_seconds",
+    "Time to write one batch of security log records",
+)
+
+
+async def write_security_logs(
+    entries: Iterable[AuditEntry],
+    session: AsyncSession | None = None,
+) -> None:
+    now = datetime.utcnow()
+    await _write_records([(now, *entry) for entry in entries], session)
+
+
+async def _write_records(
+    records: list[AuditRecord],
+    session: AsyncSession | None = None,
+) -> None:
+    settings = get_settings()
+    known = [
+        telegram_id
+        for _, telegram_id, _, _ in records
+        if telegram_id is not None
+    ]
+    digests = iter(hash_many(settings.app_secret, known))
+    encrypted = iter(encrypt_many(settings.fernet_key, map(str, known)))
+    rows = []
+    for created_at, telegram_id, action, meta in records:
+        if telegram_id is not None:
+            digest, encrypted_id = next(digests), next(encrypted)
+        else:
+            digest, encrypted_id = None, None
+        rows.append(
+            {
+                "telegram_id": encrypted_id,
+                "telegram_id_hash": digest,
+                "action": action,
+                "meta": meta,
+                "created_at": created_at,
+            }
+        )
+    await add_security_logs(rows, session=session)
+
+
+class AuditSink:
+    def __init__(
+        self,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_seconds: float = AUDIT_FLUSH_INTERVAL,
+        max_pending: int = AUDIT_MAX_PENDING,
+    ) -> None:
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self._buffer: list[AuditRecord] = []
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._closing = False
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is None:
+            return
+        self._closing = True
+        self._ready.set()
+        await task
+        await self.flush()
+
+    async def log(
+        self,
+        telegram_id: int | None,
+        action: str,
+        meta: str | None = None,
+    ) -> None:
+        if not self.running:
+            # Scripts and one-off jobs without a running sink write inline.
+            await write_security_logs([(telegram_id, action, meta)])
+            return
+        # Stamped now: the row must carry when the event happened, not
+        # when its batch was flushed.
+        record = (datetime.utcnow(), telegram_id, action, meta)
+        # A full buffer means the database is behind; callers wait here
+        # rather than letting memory grow or dropping records.
+        while len(self._buffer) >= self.max_pending:
+            self._space.clear()
+            await self._space.wait()
+        self._buffer.append(record)
+        AUDIT_PENDING.set(len(self._buffer))
+        if len(self._buffer) >= self.batch_size:
+            self._ready.set()
+
+    async def flush(self) -> None:
+        while self._buffer:
+            batch = self._buffer[: self.batch_size]
+            del self._buffer[: self.batch_size]
+            self._space.set()
+            AUDIT_PENDING.set(len(self._buffer))
+            await self._write(batch)
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._ready.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._ready.clear()
+            await self.flush()
+
+    async def _write(self, batch: list[AuditRecord]) -> None:
+        for attempt in range(AUDIT_MAX_ATTEMPTS):
+            try:
+                with AUDIT_FLUSH_SECONDS.time():
+                    await _write_records(batch)
+                AUDIT_RECORDS.inc(len(batch), outcome="written")
+                return
+            except Exception:
+                logger.exception("Security log batch write failed")
+                if attempt + 1 < AUDIT_MAX_ATTEMPTS:
+                    await asyncio.sleep(2**attempt)
+        AUDIT_RECORDS.inc(len(batch), outcome="dropped")
+        logger.error("Dropped %s security log records", len(batch))
+
+
+audit_sink = AuditSink()
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+
+from bot.db.models import Broadcast
+from bot.db.repository import (
+    add_broadcast,
+    get_broadcast,
+    list_active_users_page,
+    list_broadcasts_by_status,
+    update_broadcast_progress,
+)
+from bot.scheduler.coordination import LeaseLost, run_leased
+from bot.services.delivery import sender
+from bot.services.users import decrypt_telegram_ids
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_PAGE_SIZE = 200
+BROADCAST_CONCURRENCY = 8
+
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+_tasks: set[asyncio.Task] = set()
+
+
+@dataclass(frozen=True)
+class BroadcastReport:
+    broadcast_id: int
+    sent: int
+    failed: int
+    elapsed: float
+
+    @property
+    def rate(self) -> float:
+        return (self.sent + self.failed) / self.elapsed if self.elapsed else 0
+
+
+async def start_broadcast(bot: Bot, admin_chat_id: int, text: str) -> int:
+    broadcast = await add_broadcast(
+        Broadcast(
+            admin_chat_id=admin_chat_id,
+            text=text,
+            status=STATUS_RUNNING,
+            last_user_id=0,
+            sent=0,
+            failed=0,
+        )
+    )
+    _spawn(bot, broadcast)
+    return broadcast.id
+
+
+async def resume_broadcasts(bot: Bot) -> int:
+    broadcasts = await list_broadcasts_by_status(STATUS_RUNNING)
+    for broadcast in broadcasts:
+        _spawn(bot, broadcast)
+    return len(broadcasts)
+
+
+def _spawn(bot: Bot, broadcast: Broadcast) -> None:
+    task = asyncio.create_task(_run_leased(bot, broadcast.id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def _run_leased(bot: Bot, broadcast_id: int) -> None:
+    # Every worker resumes running broadcasts on start; the lease makes
+    # sure only one of them sends each one. The row is re-read under the
+    # lease, since another worker may have finished it in the meantime.
+    async def resume() -> None:
+        broadcast = await get_broadcast(broadcast_id)
+        if broadcast is not None and broadcast.status == STATUS_RUNNING:
+            await run_broadcast(bot, broadcast)
+
+    try:
+        await run_leased("broadcast:%s" % broadcast_id, timedelta(0), resume)
+    except LeaseLost:
+        logger.warning("Broadcast %s moved to another worker", broadcast_id)
+
+
+async def run_broadcast(bot: Bot, broadcast: Broadcast) -> BroadcastReport:
+    # Progress is persisted after every page, so a restart resumes from the
+    # last completed page and re-sends at most one page.
+    last_user_id = broadcast.last_user_id
+    sent = broadcast.sent
+    failed = broadcast.failed
+    started = time.monotonic()
+    status = STATUS_DONE
+    try:
+        while True:
+            rows = await list_active_users_page(
+                last_user_id,
+                BROADCAST_PAGE_SIZE,
+            )
+            if not rows:
+                break
+            chat_ids = decrypt_telegram_ids([value for _, value in rows])
+            targets = [chat_id for chat_id in chat_ids if chat_id is not None]
+            results = await sender.send_many(
+                bot,
+                [(chat_id, broadcast.text) for chat_id in targets],
+                concurrency=BROADCAST_CONCURRENCY,
+            )
+            sent += sum(results)
+            failed += len(rows) - sum(results)
+            last_user_id = rows[-1][0]
+            await update_broadcast_progress(
+                broadcast.id,
+                last_user_id,
+                sent,
+                failed,
+            )
+    except Exception:
+        logger.exception("Broadcast %s failed", broadcast.id)
+        status = STATUS_FAILED
+
+    await update_broadcast_progress(
+        broadcast.id,
+        last_user_id,
+        sent,
+        failed,
+        status=status,
+        finished_at=datetime.utcnow(),
+    )
+    report = BroadcastReport(
+        broadcast.id,
+        sent - broadcast.sent,
+        failed - broadcast.failed,
+        time.monotonic() - started,
+    )
+    await _notify_admin(bot, broadcast, report, status, sent, failed)
+    return report
+
+
+async def _notify_admin(
+    bot: Bot,
+    broadcast: Broadcast,
+    report: BroadcastReport,
+    status: str,
+    sent: int,
+    failed: int,
+) -> None:
+    if status == STATUS_DONE:
+        title = "Broadcast Finished"
+    else:
+        title = "Broadcast Failed"
+    try:
+        await bot.send_message(
+            broadcast.admin_chat_id,
+            (
+                f"📢 <b>{title}</b> #{broadcast.id}\n\n"
+                f"Delivered: {sent}\n"
+                f"Failed: {failed}\n"
+                f"Throughput: {report.rate:.1f} msg/s "
+                f"over {report.elapsed:.0f}s"
+            ),
+            parse_mode="HTML",
+        )
+    except Exception:
+        logger.exception("Could not report broadcast %s", broadcast.id)
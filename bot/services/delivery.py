@@ -0,0 +1,70 @@
+import asyncio
+import logging
+from typing import Any, Iterable
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramBadRequest,
+    TelegramForbiddenError,
+)
+
+from bot.middlewares.pacing import PRIORITY_BULK, api_priority
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRIES = 3
+DEFAULT_CONCURRENCY = 8
+
+
+class RateLimitedSender:
+    # Pacing and flood-control waits are done by the Bot session's
+    # OutboundPacer; bulk sends queue behind payments, invites and
+    # interactive replies there.
+    async def send_message(
+        self,
+        bot: Bot,
+        chat_id: int,
+        text: str,
+        **kwargs: Any,
+    ) -> bool:
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                with api_priority(PRIORITY_BULK):
+                    await bot.send_message(chat_id, text, **kwargs)
+                return True
+            except (TelegramForbiddenError, TelegramBadRequest):
+                return False
+            except TelegramAPIError:
+                if attempt < MAX_RETRIES:
+                    await asyncio.sleep(2**attempt)
+        return False
+
+    async def send_many(
+        self,
+        bot: Bot,
+        messages: Iterable[tuple[int, str]],
+        concurrency: int = DEFAULT_CONCURRENCY,
+        **kwargs: Any,
+    ) -> list[bool]:
+        queue: asyncio.Queue[tuple[int, int, str]] = asyncio.Queue()
+        for index, (chat_id, text) in enumerate(messages):
+            queue.put_nowait((index, chat_id, text))
+        results = [False] * queue.qsize()
+
+        async def worker() -> None:
+            while not queue.empty():
+                index, chat_id, text = queue.get_nowait()
+                results[index] = await self.send_message(
+                    bot,
+                    chat_id,
+                    text,
+                    **kwargs,
+                )
+
+        workers = min(concurrency, len(results))
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        return results
+
+
+sender = RateLimitedSender()
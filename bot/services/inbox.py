@@ -0,0 +1,208 @@
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+
+from bot.db.repository import (
+    INBOX_DONE,
+    INBOX_FAILED,
+    INBOX_PENDING,
+    add_tinkoff_event,
+    claim_tinkoff_events,
+    finish_tinkoff_event,
+    get_tinkoff_inbox_stats,
+    requeue_stuck_tinkoff_events,
+)
+from bot.metrics import counter, gauge, histogram
+from bot.middlewares.pacing import PRIORITY_PAYMENT, api_priority
+from bot.services.invites import issue_invite_link
+from bot.services.payments import process_tinkoff_webhook
+from bot.services.subscriptions import log_security_action
+
+logger = logging.getLogger(__name__)
+
+INBOX_WORKERS = 4
+INBOX_BATCH_SIZE = 20
+INBOX_POLL_SECONDS = 1.0
+INBOX_MAX_ATTEMPTS = 8
+INBOX_RETRY_BASE_SECONDS = 5
+# A claim older than this is taken to belong to a worker that died.
+INBOX_STUCK_TIMEOUT = timedelta(minutes=10)
+INBOX_REQUEUE_SECONDS = 60.0
+
+INBOX_DEPTH = gauge(
+    "tinkoff_inbox_depth",
+    "Tinkoff notifications waiting to be processed",
+)
+INBOX_LAG = gauge(
+    "tinkoff_inbox_lag_seconds",
+    "Age of the oldest pending Tinkoff notification",
+)
+INBOX_EVENTS = counter(
+    "tinkoff_inbox_events_total",
+    "Tinkoff notifications by processing outcome",
+    ("outcome",),
+)
+INBOX_SECONDS = histogram(
+    "tinkoff_inbox_processing_seconds",
+    "Time to process one Tinkoff notification",
+)
+
+
+async def enqueue_tinkoff_notification(payload: dict[str, str]) -> bool:
+    order_id = payload.get("OrderId") or payload.get("OrderID")
+    status = payload.get("Status") or "unknown"
+    inserted = await add_tinkoff_event(order_id, status, json.dumps(payload))
+    INBOX_EVENTS.inc(outcome="received" if inserted else "duplicate")
+    return inserted
+
+
+async def handle_tinkoff_notification(
+    bot: Bot,
+    payload: dict[str, str],
+) -> None:
+    # Everything that must be retried happens in process_tinkoff_webhook's
+    # single transaction. Once the grant is committed, a failed invite or
+    # message is logged rather than retried, so a retry never grants twice;
+    # the user can still get a link via /access.
+    result = await process_tinkoff_webhook(payload)
+    if not result.ok:
+        raise ValueError(result.message)
+    if not (result.telegram_id and result.tariff):
+        return
+    try:
+        invite = await issue_invite_link(bot, result.telegram_id, None)
+        await bot.send_message(
+            result.telegram_id,
+            (
+                "Оплата принята. Доступ активирован на %s месяцев. "
+                "Вот твой инвайт:\n%s"
+            )
+            % (result.tariff.months, invite),
+        )
+    except Exception:
+        logger.exception("Invite delivery failed for a Tinkoff payment")
+        await log_security_action(
+            result.telegram_id,
+            "tinkoff_invite_failed",
+            "order_id=%s" % payload.get("OrderId"),
+        )
+
+
+class TinkoffInbox:
+    def __init__(self, bot: Bot, workers: int = INBOX_WORKERS) -> None:
+        self.bot = bot
+        self.workers = workers
+        self._wakeup = asyncio.Event()
+        self._queue: asyncio.Queue[tuple[int, str, int]] = asyncio.Queue(
+            maxsize=INBOX_BATCH_SIZE
+        )
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._poll())]
+        # Workers deliver payment confirmations, the most urgent traffic.
+        with api_priority(PRIORITY_PAYMENT):
+            self._tasks += [
+                asyncio.create_task(self._work())
+                for _ in range(self.workers)
+            ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def _poll(self) -> None:
+        next_requeue = 0.0
+        while True:
+            try:
+                if time.monotonic() >= next_requeue:
+                    await self._requeue_stuck()
+                    next_requeue = time.monotonic() + INBOX_REQUEUE_SECONDS
+                await self._refresh_metrics()
+                events = await claim_tinkoff_events(
+                    datetime.utcnow(),
+                    INBOX_BATCH_SIZE,
+                )
+            except Exception:
+                logger.exception("Tinkoff inbox poll failed")
+                events = []
+            for event in events:
+                await self._queue.put(event)
+            if len(events) < INBOX_BATCH_SIZE:
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(),
+                        INBOX_POLL_SECONDS,
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def _work(self) -> None:
+        while True:
+            event_id, payload, attempts = await self._queue.get()
+            try:
+                await self._process(event_id, payload, attempts)
+            except Exception:
+                logger.exception("Tinkoff event %s not recorded", event_id)
+            finally:
+                self._queue.task_done()
+
+    async def _process(
+        self,
+        event_id: int,
+        payload: str,
+        attempts: int,
+    ) -> None:
+        started = time.perf_counter()
+        try:
+            await handle_tinkoff_notification(self.bot, json.loads(payload))
+        except Exception as exc:
+            logger.exception("Tinkoff event %s failed", event_id)
+            # ValueError means the notification itself is unusable (bad
+            # order id, unknown tariff); retrying cannot fix it.
+            permanent = isinstance(exc, ValueError)
+            if permanent or attempts >= INBOX_MAX_ATTEMPTS:
+                outcome = INBOX_FAILED
+                await finish_tinkoff_event(event_id, INBOX_FAILED, str(exc))
+            else:
+                outcome = "retry"
+                delay = INBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+                await finish_tinkoff_event(
+                    event_id,
+                    INBOX_PENDING,
+                    str(exc),
+                    retry_at=datetime.utcnow() + timedelta(seconds=delay),
+                )
+        else:
+            outcome = INBOX_DONE
+            await finish_tinkoff_event(event_id, INBOX_DONE)
+        INBOX_EVENTS.inc(outcome=outcome)
+        INBOX_SECONDS.observe(time.perf_counter() - started)
+
+    async def _requeue_stuck(self) -> None:
+        # Other workers may be live, so only claims older than the timeout
+        # are taken back; checked periodically, not just on start, so a
+        # dead worker's events are recovered without a restart.
+        requeued = await requeue_stuck_tinkoff_events(
+            datetime.utcnow() - INBOX_STUCK_TIMEOUT
+        )
+        if requeued:
+            logger.warning("Requeued %s stuck Tinkoff events", requeued)
+
+    async def _refresh_metrics(self) -> None:
+        depth, oldest = await get_tinkoff_inbox_stats()
+        INBOX_DEPTH.set(depth)
+        if oldest is None:
+            INBOX_LAG.set(0)
+        else:
+            INBOX_LAG.set((datetime.utcnow() - oldest).total_seconds())
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+from bot.config import get_settings
+from bot.db.models import Invite
+from bot.db.repository import (
+    add_pooled_invites,
+    claim_pooled_invite,
+    count_pooled_invites,
+    delete_stale_pooled_invites,
+)
+from bot.metrics import counter, gauge
+from bot.middlewares.pacing import PRIORITY_BULK, api_priority
+
+logger = logging.getLogger(__name__)
+
+INVITE_TTL_MINUTES = 30
+POOL_TTL = timedelta(minutes=INVITE_TTL_MINUTES)
+# A pooled link is handed out only while the user still has this long to
+# use it; older ones are dropped from the pool and left to expire.
+POOL_MIN_REMAINING = timedelta(minutes=10)
+POOL_MIN_SIZE = 2
+POOL_MAX_SIZE = 50
+POOL_DEMAND_WINDOW_SECONDS = 30 * 60
+POOL_HEADROOM = 1.5
+POOL_REFILL_SECONDS = 60.0
+
+POOL_SIZE = gauge("invite_pool_size", "Usable pre-minted invite links")
+POOL_CLAIMS = counter(
+    "invite_pool_claims_total",
+    "Invite issuances by where the link came from",
+    ("source",),
+)
+
+
+class InvitePool:
+    def __init__(self) -> None:
+        self._claims: deque[float] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def start(self, bot: Bot) -> None:
+        # The task copies the current context, so its Bot API calls queue
+        # as background work.
+        with api_priority(PRIORITY_BULK):
+            self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def target_size(self) -> int:
+        # Enough links to cover the last window's claims with headroom,
+        # since every pooled link lives for about one window.
+        cutoff = time.monotonic() - POOL_DEMAND_WINDOW_SECONDS
+        while self._claims and self._claims[0] < cutoff:
+            self._claims.popleft()
+        wanted = math.ceil(len(self._claims) * POOL_HEADROOM)
+        return max(POOL_MIN_SIZE, min(POOL_MAX_SIZE, wanted))
+
+    async def claim(self, invite: Invite) -> Invite | None:
+        self._claims.append(time.monotonic())
+        pooled = await claim_pooled_invite(
+            datetime.utcnow() + POOL_MIN_REMAINING,
+            invite,
+        )
+        POOL_CLAIMS.inc(source="pool" if pooled else "live")
+        self._wakeup.set()
+        return pooled
+
+    async def refill(self, bot: Bot) -> int:
+        settings = get_settings()
+        valid_after = datetime.utcnow() + POOL_MIN_REMAINING
+        await delete_stale_pooled_invites(valid_after)
+        available = await count_pooled_invites(valid_after)
+        rows = []
+        try:
+            for _ in range(self.target_size() - available):
+                expires_at = datetime.utcnow() + POOL_TTL
+                invite = await bot.create_chat_invite_link(
+                    chat_id=settings.admin_channel_id,
+                    member_limit=1,
+                    expire_date=expires_at,
+                )
+                rows.append(
+                    {
+                        "invite_link": invite.invite_link,
+                        "expires_at": expires_at,
+                    }
+                )
+        except TelegramRetryAfter as exc:
+            logger.warning("Invite pool throttled for %ss", exc.retry_after)
+        except TelegramAPIError:
+            logger.exception("Invite pool refill failed")
+        finally:
+            await add_pooled_invites(rows)
+        POOL_SIZE.set(available + len(rows))
+        return len(rows)
+
+    async def _run(self, bot: Bot) -> None:
+        while True:
+            try:
+                await self.refill(bot)
+            except Exception:
+                logger.exception("Invite pool refill failed")
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(),
+                    POOL_REFILL_SECONDS,
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+invite_pool = InvitePool()
@@ -1,3 +1,5 @@
+import asyncio
+import logging
 from datetime import datetime, timedelta
 
 from aiogram import Bot
@@ -10,12 +12,15 @@ from bot.db.repository import (
     save_invite,
 )
 from bot.security.crypto import encrypt_text, telegram_id_hash
+from bot.services.invite_pool import INVITE_TTL_MINUTES, invite_pool
 from bot.services.subscriptions import (
     has_active_subscription,
     log_security_action,
 )
 
-INVITE_TTL_MINUTES = 30
+logger = logging.getLogger(__name__)
+
+_revoke_tasks: set[asyncio.Task] = set()
 
 
 def _build_invite_expires() -> datetime:
@@ -27,58 +32,88 @@ async def issue_invite_link(
     telegram_id: int,
     username: str | None,
 ) -> str:
-    settings = get_settings()
-    if not has_active_subscription(telegram_id):
-        log_security_action(telegram_id, "invite_denied_no_subscription", None)
+    if not await has_active_subscription(telegram_id):
+        await log_security_action(
+            telegram_id,
+            "invite_denied_no_subscription",
+            None,
+        )
         raise ValueError("No active subscription")
+    return await create_invite_link(bot, telegram_id, username)
 
-    active_invite = get_active_invite_for_user(telegram_id)
-    if active_invite and not active_invite.is_used:
-        try:
-            await bot.revoke_chat_invite_link(
-                settings.admin_channel_id,
-                active_invite.invite_link,
-            )
-        except Exception:
-            log_security_action(telegram_id, "invite_revoke_failed", None)
-
-    expires_at = _build_invite_expires()
-    invite = await bot.create_chat_invite_link(
-        chat_id=settings.admin_channel_id,
-        member_limit=1,
-        expire_date=expires_at,
-    )
+
+async def create_invite_link(
+    bot: Bot,
+    telegram_id: int,
+    username: str | None,
+) -> str:
+    # Takes no session on purpose: the fallback below is a paced Bot API
+    # call, which must never run inside a caller's open transaction.
+    settings = get_settings()
+    active_invite = await get_active_invite_for_user(telegram_id)
 
     encrypted_id = encrypt_text(settings.fernet_key, str(telegram_id))
     digest = telegram_id_hash(settings.app_secret, telegram_id)
     record = Invite(
         telegram_id=encrypted_id,
         telegram_id_hash=digest,
-        invite_link=invite.invite_link,
         is_used=False,
-        expires_at=expires_at,
     )
-    save_invite(record)
-    log_security_action(
+
+    # A pre-minted link makes issuance a single claim-and-save transaction;
+    # the Bot API is only called inline when the pool has run dry.
+    if await invite_pool.claim(record) is None:
+        record.expires_at = _build_invite_expires()
+        invite = await bot.create_chat_invite_link(
+            chat_id=settings.admin_channel_id,
+            member_limit=1,
+            expire_date=record.expires_at,
+        )
+        record.invite_link = invite.invite_link
+        await save_invite(record)
+    invite_link = record.invite_link
+    await log_security_action(
         telegram_id,
         "invite_issued",
         "username=%s" % (username or ""),
     )
-    return invite.invite_link
+    if active_invite is not None:
+        _revoke_later(bot, telegram_id, active_invite.invite_link)
+    return invite_link
+
+
+def _revoke_later(bot: Bot, telegram_id: int, invite_link: str) -> None:
+    # The user already has the new link; the old one is revoked off the
+    # delivery path.
+    task = asyncio.create_task(_revoke(bot, telegram_id, invite_link))
+    _revoke_tasks.add(task)
+    task.add_done_callback(_revoke_tasks.discard)
+
+
+async def _revoke(bot: Bot, telegram_id: int, invite_link: str) -> None:
+    settings = get_settings()
+    try:
+        await bot.revoke_chat_invite_link(
+            settings.admin_channel_id,
+            invite_link,
+        )
+    except Exception:
+        logger.warning("Could not revoke a previous invite link")
+        await log_security_action(telegram_id, "invite_revoke_failed", None)
 
 
-def mark_invite_used_by_link(invite_link: str) -> None:
-    mark_invite_used(invite_link)
+async def mark_invite_used_by_link(invite_link: str) -> None:
+    await mark_invite_used(invite_link)
 
 
-def log_join(telegram_id: int, invite_link: str | None) -> None:
+async def log_join(telegram_id: int, invite_link: str | None) -> None:
     meta = (
         "invite_link=%s" % invite_link
         if invite_link
         else "invite_link=unknown"
     )
-    log_security_action(telegram_id, "channel_join", meta)
+    await log_security_action(telegram_id, "channel_join", meta)
 
 
-def log_leave(telegram_id: int) -> None:
-    log_security_action(telegram_id, "channel_leave", None)
+async def log_leave(telegram_id: int) -> None:
+    await log_security_action(telegram_id, "channel_leave", None)
@@ -0,0 +1,78 @@
+import logging
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InputFile, Message
+from aiogram.types.input_file import FSInputFile
+
+from bot.db.repository import (
+    delete_media_file_id,
+    get_media_file_id,
+    save_media_file_id,
+)
+
+logger = logging.getLogger(__name__)
+
+_file_ids: dict[str, str] = {}
+
+# Bad Request messages that mean the cached file_id itself is unusable.
+# Anything else (bad caption, message not modified, chat not found) says
+# nothing about the file and must not cost a cache entry and an upload.
+FILE_ID_ERRORS = (
+    "wrong file identifier",
+    "wrong remote file identifier",
+    "file reference",
+    "file_reference",
+    "media_empty",
+)
+
+
+def _is_file_id_error(exc: TelegramBadRequest) -> bool:
+    message = exc.message.lower()
+    return any(marker in message for marker in FILE_ID_ERRORS)
+
+
+async def get_file_id(key: str) -> str | None:
+    file_id = _file_ids.get(key)
+    if file_id is None:
+        file_id = await get_media_file_id(key)
+        if file_id is not None:
+            _file_ids[key] = file_id
+    return file_id
+
+
+async def remember_file_id(key: str, message: Message | bool) -> None:
+    if not isinstance(message, Message) or not message.photo:
+        return
+    file_id = message.photo[-1].file_id
+    if _file_ids.get(key) == file_id:
+        return
+    _file_ids[key] = file_id
+    await save_media_file_id(key, file_id)
+
+
+async def forget_file_id(key: str) -> None:
+    _file_ids.pop(key, None)
+    await delete_media_file_id(key)
+
+
+async def send_cached_photo(
+    key: str,
+    path: Path,
+    send: Callable[[str | InputFile], Awaitable[Message | bool]],
+) -> Message | bool:
+    # Uploads the file once; later sends reuse Telegram's file_id, which is
+    # persisted so restarts do not trigger a fresh upload either.
+    file_id = await get_file_id(key)
+    if file_id is not None:
+        try:
+            return await send(file_id)
+        except TelegramBadRequest as exc:
+            if not _is_file_id_error(exc):
+                raise
+            logger.warning("Cached file_id for %s rejected, re-uploading", key)
+            await forget_file_id(key)
+    sent = await send(FSInputFile(path))
+    await remember_file_id(key, sent)
+    return sent
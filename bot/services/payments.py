@@ -1,20 +1,33 @@
 import hashlib
-import time
+import hmac
+import secrets
 from dataclasses import dataclass
+from datetime import datetime
 
-import httpx
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
 from aiogram.types import LabeledPrice
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.config import get_settings
-from bot.db.models import Payment
+from bot.db.models import Payment, User
 from bot.db.repository import (
     add_payment,
-    get_payment_by_order_id,
+    claim_payment_key,
+    get_payment_with_user,
+    is_recent_payment_key,
+    unit_of_work,
     update_payment_status,
 )
 from bot.security.crypto import decrypt_text, encrypt_text, telegram_id_hash
-from bot.services.subscriptions import grant_subscription, log_security_action
+from bot.services.invites import create_invite_link
+from bot.services.subscriptions import (
+    ensure_user,
+    grant_subscription,
+    log_security_action,
+)
 from bot.services.tariffs import Tariff, get_tariff
+from bot.services.tinkoff import get_tinkoff_client
 
 
 @dataclass(frozen=True)
@@ -36,6 +49,14 @@ class TinkoffPaymentResult:
     status: str | None
 
 
+@dataclass(frozen=True)
+class PurchaseResult:
+    tariff: Tariff
+    subscription_end: datetime | None
+    invite_link: str | None
+    duplicate: bool = False
+
+
 def build_stars_invoice(tariff: Tariff) -> InvoiceData:
     return InvoiceData(
         title="Доступ к архиву",
@@ -52,7 +73,7 @@ def build_stars_invoice(tariff: Tariff) -> InvoiceData:
     )
 
 
-def record_payment(
+async def record_payment(
     telegram_id: int,
     amount: int,
     currency: str,
@@ -60,6 +81,9 @@ def record_payment(
     status: str,
     order_id: str | None = None,
     payload: str | None = None,
+    user_id: int | None = None,
+    tariff_code: str | None = None,
+    session: AsyncSession | None = None,
 ) -> Payment:
     settings = get_settings()
     encrypted_id = encrypt_text(settings.fernet_key, str(telegram_id))
@@ -67,6 +91,8 @@ def record_payment(
     payment = Payment(
         telegram_id=encrypted_id,
         telegram_id_hash=digest,
+        user_id=user_id,
+        tariff_code=tariff_code,
         amount=amount,
         currency=currency,
         method=method,
@@ -74,46 +100,110 @@ def record_payment(
         order_id=order_id,
         payload=payload,
     )
-    return add_payment(payment)
+    return await add_payment(payment, session=session)
+
+
+async def complete_purchase(
+    bot: Bot,
+    telegram_id: int,
+    username: str | None,
+    tariff: Tariff,
+    amount: int,
+    currency: str,
+    method: str,
+    idempotency_key: str,
+    payload: str | None = None,
+) -> PurchaseResult:
+    if is_recent_payment_key(idempotency_key):
+        return PurchaseResult(tariff, None, None, duplicate=True)
+    async with unit_of_work() as session:
+        if not await claim_payment_key(idempotency_key, session=session):
+            return PurchaseResult(tariff, None, None, duplicate=True)
+        update = await grant_subscription(
+            telegram_id,
+            username,
+            tariff.code,
+            session=session,
+        )
+        await record_payment(
+            telegram_id,
+            amount,
+            currency,
+            method,
+            "paid",
+            payload=payload,
+            user_id=update.user.id,
+            tariff_code=tariff.code,
+            session=session,
+        )
+    # The invite may need a live Bot API call, so it is issued only after
+    # the payment and subscription have committed.
+    try:
+        invite_link = await create_invite_link(bot, telegram_id, username)
+    except TelegramAPIError:
+        invite_link = None
+        await log_security_action(telegram_id, "invite_create_failed", None)
+    return PurchaseResult(tariff, update.new_end, invite_link)
+
+
+def stars_payment_key(charge_id: str) -> str:
+    return "stars:%s" % charge_id
+
 
+def tinkoff_payment_key(order_id: str) -> str:
+    return "tinkoff:%s" % order_id
 
-def handle_successful_payment(
+
+async def handle_successful_payment(
+    bot: Bot,
     telegram_id: int,
     username: str | None,
     payload: str,
     total_amount: int,
-) -> Tariff:
+    charge_id: str,
+) -> PurchaseResult:
     if not payload.startswith("sub_"):
         raise ValueError("Unknown payload")
     tariff_code = payload.replace("sub_", "")
     tariff = get_tariff(tariff_code)
-    record_payment(
+    return await complete_purchase(
+        bot,
         telegram_id,
+        username,
+        tariff,
         total_amount,
         "XTR",
         "stars",
-        "paid",
+        stars_payment_key(charge_id),
         payload=payload,
     )
-    grant_subscription(telegram_id, username, tariff.code)
-    return tariff
 
 
-def build_tinkoff_order_id(tariff_code: str, telegram_hash: str) -> str:
-    stamp = int(time.time())
-    return "sub_%s_%s_%s" % (tariff_code, telegram_hash, stamp)
+def build_tinkoff_order_id(tariff_code: str) -> str:
+    # Tinkoff caps OrderId at 36 characters. The order is resolved through
+    # its payments row, so the id only has to be unique.
+    return "sub_%s_%s" % (tariff_code, secrets.token_hex(8))
+
 
+def _token_value(value: object) -> str:
+    # Notifications carry JSON booleans; Tinkoff signs them as lowercase
+    # "true"/"false", not Python's str(True).
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
 
-def build_tinkoff_token(params: dict[str, str], secret: str) -> str:
-    items = [secret]
-    for key in sorted(params.keys()):
-        if key.lower() == "token":
+
+def build_tinkoff_token(params: dict[str, object], secret: str) -> str:
+    # Root-level scalars plus the password, sorted by key and concatenated;
+    # nested objects (Receipt, DATA) are not signed.
+    signed = {"Password": secret}
+    for key, value in params.items():
+        if key.lower() == "token" or value is None:
             continue
-        value = params[key]
-        if value is None:
+        if isinstance(value, (dict, list)):
             continue
-        items.append(str(value))
-    raw = "".join(items)
+        signed[key] = _token_value(value)
+    raw = "".join(signed[key] for key in sorted(signed))
     return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
 
@@ -122,7 +212,7 @@ def verify_tinkoff_signature(params: dict[str, str]) -> bool:
     if "Token" not in params:
         return False
     expected = build_tinkoff_token(params, settings.tinkoff_secret)
-    return expected == params["Token"]
+    return hmac.compare_digest(expected, str(params["Token"]))
 
 
 def build_tinkoff_init_payload(
@@ -130,8 +220,7 @@ def build_tinkoff_init_payload(
     tariff: Tariff,
 ) -> dict[str, str]:
     settings = get_settings()
-    telegram_hash = telegram_id_hash(settings.app_secret, telegram_id)
-    order_id = build_tinkoff_order_id(tariff.code, telegram_hash)
+    order_id = build_tinkoff_order_id(tariff.code)
     amount_kopeks = tariff.price_rub * 100
     params = {
         "TerminalKey": settings.tinkoff_terminal_key,
@@ -146,18 +235,13 @@ def build_tinkoff_init_payload(
     return params
 
 
-def create_tinkoff_payment_link(telegram_id: int, tariff: Tariff) -> str:
+async def create_tinkoff_payment_link(telegram_id: int, tariff: Tariff) -> str:
     params = build_tinkoff_init_payload(telegram_id, tariff)
-    response = httpx.post(
-        "https://securepay.tinkoff.ru/v2/Init",
-        json=params,
-        timeout=20.0,
-    )
-    response.raise_for_status()
-    data = response.json()
-    if not data.get("Success"):
-        raise RuntimeError("Tinkoff init failed: %s" % data.get("Message"))
-    record_payment(
+    user = await ensure_user(telegram_id, None)
+    # The pending row is committed before Init: a notification can arrive
+    # as soon as Tinkoff accepts the order, and it is resolved through this
+    # row. If Init fails the row is kept but marked, for the record.
+    payment = await record_payment(
         telegram_id=telegram_id,
         amount=int(params["Amount"]),
         currency="RUB",
@@ -165,33 +249,20 @@ def create_tinkoff_payment_link(telegram_id: int, tariff: Tariff) -> str:
         status="pending",
         order_id=params["OrderId"],
         payload="sub_%s" % tariff.code,
+        user_id=user.id,
+        tariff_code=tariff.code,
     )
-    return data["PaymentURL"]
-
-
-def _parse_tinkoff_order_id(order_id: str) -> tuple[str, str] | None:
-    parts = order_id.split("_")
-    if len(parts) < 4 or parts[0] != "sub":
-        return None
-    tariff_code = parts[1]
-    telegram_hash = parts[2]
-    return tariff_code, telegram_hash
-
-
-def resolve_telegram_id_from_hash(telegram_hash: str) -> int | None:
-    from bot.db.repository import get_user_by_hash
-
-    settings = get_settings()
-    user = get_user_by_hash(telegram_hash)
-    if user is None:
-        return None
     try:
-        return int(decrypt_text(settings.fernet_key, user.telegram_id))
+        data = await get_tinkoff_client().init_payment(params)
     except Exception:
-        return None
+        await update_payment_status(payment.id, "init_failed")
+        raise
+    return data["PaymentURL"]
 
 
-def process_tinkoff_webhook(payload: dict[str, str]) -> TinkoffPaymentResult:
+async def process_tinkoff_webhook(
+    payload: dict[str, str],
+) -> TinkoffPaymentResult:
     if not verify_tinkoff_signature(payload):
         return TinkoffPaymentResult(
             False,
@@ -212,33 +283,84 @@ def process_tinkoff_webhook(payload: dict[str, str]) -> TinkoffPaymentResult:
             status,
         )
 
-    parsed = _parse_tinkoff_order_id(order_id)
-    if not parsed:
-        return TinkoffPaymentResult(False, "Bad OrderId", None, None, status)
+    idempotency_key = tinkoff_payment_key(order_id)
+    if status == "CONFIRMED" and is_recent_payment_key(idempotency_key):
+        return TinkoffPaymentResult(True, "Duplicate", None, None, status)
+    async with unit_of_work() as session:
+        # The pending payment carries its user and tariff, so the order is
+        # resolved with one indexed join instead of parsing the OrderId.
+        row = await get_payment_with_user(order_id, session=session)
+        if row is None:
+            await log_security_action(
+                None,
+                "tinkoff_order_not_found",
+                "order_id=%s" % order_id,
+                session=session,
+            )
+            return TinkoffPaymentResult(
+                False,
+                "Unknown OrderId",
+                None,
+                None,
+                status,
+            )
+        payment, user = row
+        await update_payment_status(
+            payment.id,
+            status or "unknown",
+            session=session,
+        )
 
-    tariff_code, telegram_hash = parsed
-    payment = get_payment_by_order_id(order_id)
-    if payment:
-        update_payment_status(payment.id, status or "unknown")
+        if status != "CONFIRMED":
+            return TinkoffPaymentResult(
+                True,
+                "Payment not confirmed",
+                None,
+                None,
+                status,
+            )
 
-    if status != "CONFIRMED":
-        return TinkoffPaymentResult(
-            True,
-            "Payment not confirmed",
-            None,
-            None,
-            status,
-        )
+        if not await claim_payment_key(idempotency_key, session=session):
+            return TinkoffPaymentResult(
+                True,
+                "Duplicate",
+                None,
+                None,
+                status,
+            )
+
+        telegram_id = _decrypt_telegram_id(user)
+        if telegram_id is None:
+            await log_security_action(
+                None,
+                "tinkoff_user_not_found",
+                "order_id=%s" % order_id,
+                session=session,
+            )
+            return TinkoffPaymentResult(
+                True,
+                "User not found",
+                None,
+                None,
+                status,
+            )
 
-    telegram_id = resolve_telegram_id_from_hash(telegram_hash)
-    if telegram_id is None:
-        log_security_action(
+        tariff = get_tariff(payment.tariff_code or "")
+        await grant_subscription(
+            telegram_id,
             None,
-            "tinkoff_user_not_found",
-            "order_id=%s" % order_id,
+            tariff.code,
+            session=session,
+            user=user,
         )
-        return TinkoffPaymentResult(True, "User not found", None, None, status)
-
-    tariff = get_tariff(tariff_code)
-    grant_subscription(telegram_id, None, tariff.code)
     return TinkoffPaymentResult(True, "Paid", telegram_id, tariff, status)
+
+
+def _decrypt_telegram_id(user: User | None) -> int | None:
+    if user is None:
+        return None
+    settings = get_settings()
+    try:
+        return int(decrypt_text(settings.fernet_key, user.telegram_id))
+    except Exception:
+        return None
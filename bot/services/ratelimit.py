@@ -0,0 +1,92 @@
+import asyncio
+import time
+from typing import Callable, Hashable
+
+
+class TokenBucket:
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def delay(self, tokens: float = 1.0) -> float:
+        now = self.clock()
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < tokens:
+            wait = max(wait, (tokens - self.tokens) / self.rate)
+        return wait
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        if self.delay(tokens) > 0:
+            return False
+        self.tokens -= tokens
+        return True
+
+    async def acquire(self, tokens: float = 1.0) -> float:
+        # Waiters are served in arrival order; returns the time spent waiting.
+        started = self.clock()
+        async with self._lock:
+            while True:
+                wait = self.delay(tokens)
+                if wait <= 0:
+                    self.tokens -= tokens
+                    return self.clock() - started
+                await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        now = self.clock()
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self._refill(now)
+        self.tokens = 0.0
+
+    @property
+    def idle(self) -> bool:
+        return self.delay(self.capacity) <= 0
+
+
+class KeyedTokenBuckets:
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        max_keys: int = 10_000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: dict[Hashable, TokenBucket] = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def get(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._prune()
+            bucket = TokenBucket(self.rate, self.capacity, self.clock)
+            self._buckets[key] = bucket
+        return bucket
+
+    def _prune(self) -> None:
+        # A full, unpaused bucket carries no state worth keeping.
+        for key in [k for k, b in self._buckets.items() if b.idle]:
+            del self._buckets[key]
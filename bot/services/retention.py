@@ -0,0 +1,173 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from bot.config import get_settings
+from bot.db.models import SecurityLog
+from bot.db.repository import (
+    delete_security_logs,
+    list_security_logs_before,
+    search_security_logs,
+)
+from bot.metrics import counter
+
+logger = logging.getLogger(__name__)
+
+COMPACTION_CHUNK_SIZE = 5000
+
+ARCHIVED_ROWS = counter(
+    "security_logs_archived_total",
+    "Security log rows moved from the database into archive files",
+)
+
+
+@dataclass(frozen=True)
+class SecurityLogRecord:
+    id: int
+    telegram_id: str | None
+    telegram_id_hash: str | None
+    action: str
+    meta: str | None
+    created_at: datetime
+
+    @classmethod
+    def from_row(cls, row: SecurityLog) -> "SecurityLogRecord":
+        return cls(
+            row.id,
+            row.telegram_id,
+            row.telegram_id_hash,
+            row.action,
+            row.meta,
+            row.created_at,
+        )
+
+    def to_json(self) -> str:
+        data = asdict(self)
+        data["created_at"] = self.created_at.isoformat()
+        return json.dumps(data, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, line: str) -> "SecurityLogRecord":
+        data = json.loads(line)
+        data["created_at"] = datetime.fromisoformat(data["created_at"])
+        return cls(**data)
+
+
+def _month(moment: datetime) -> str:
+    return moment.strftime("%Y-%m")
+
+
+def _write_archive(
+    archive_dir: Path,
+    records: list[SecurityLogRecord],
+) -> list[Path]:
+    # One gzip JSONL file per month and id range. The rows are deleted only
+    # after their file is in place, so an interrupted run leaves them in the
+    # database and the rerun rewrites the same file names.
+    by_month: dict[str, list[SecurityLogRecord]] = {}
+    for record in records:
+        by_month.setdefault(_month(record.created_at), []).append(record)
+    paths = []
+    for month, chunk in sorted(by_month.items()):
+        directory = archive_dir / month
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / (
+            "%010d-%010d.jsonl.gz" % (chunk[0].id, chunk[-1].id)
+        )
+        tmp = path.with_suffix(".tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8") as handle:
+            for record in chunk:
+                handle.write(record.to_json() + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp, path)
+        paths.append(path)
+    return paths
+
+
+async def compact_security_logs(
+    now: datetime,
+    retention_days: int | None = None,
+    archive_dir: str | None = None,
+) -> int:
+    settings = get_settings()
+    if retention_days is None:
+        retention_days = settings.security_log_retention_days
+    root = Path(archive_dir or settings.security_log_archive_dir)
+    cutoff = now - timedelta(days=retention_days)
+    archived = 0
+    while True:
+        rows = await list_security_logs_before(cutoff, COMPACTION_CHUNK_SIZE)
+        if not rows:
+            break
+        records = [SecurityLogRecord.from_row(row) for row in rows]
+        await asyncio.to_thread(_write_archive, root, records)
+        archived += await delete_security_logs([r.id for r in records])
+        ARCHIVED_ROWS.inc(len(records))
+    if archived:
+        logger.info("Archived %s security log rows to %s", archived, root)
+    return archived
+
+
+def _months_between(start: datetime, end: datetime) -> list[str]:
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append("%04d-%02d" % (year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def _read_archive(
+    archive_dir: Path,
+    telegram_id_hash: str,
+    start: datetime,
+    end: datetime,
+) -> list[SecurityLogRecord]:
+    found = []
+    for month in _months_between(start, end):
+        directory = archive_dir / month
+        if not directory.is_dir():
+            continue
+        for path in sorted(directory.glob("*.jsonl.gz")):
+            with gzip.open(path, "rt", encoding="utf-8") as handle:
+                for line in handle:
+                    # Cheap substring test before parsing the line.
+                    if telegram_id_hash not in line:
+                        continue
+                    record = SecurityLogRecord.from_json(line)
+                    if (
+                        record.telegram_id_hash == telegram_id_hash
+                        and start <= record.created_at < end
+                    ):
+                        found.append(record)
+    return found
+
+
+async def find_security_logs(
+    telegram_id_hash: str,
+    start: datetime,
+    end: datetime,
+    archive_dir: str | None = None,
+) -> list[SecurityLogRecord]:
+    settings = get_settings()
+    root = Path(archive_dir or settings.security_log_archive_dir)
+    archived = await asyncio.to_thread(
+        _read_archive,
+        root,
+        telegram_id_hash,
+        start,
+        end,
+    )
+    live = await search_security_logs(telegram_id_hash, start, end)
+    # A row can be in both places if a compaction run was interrupted
+    # between writing its archive and deleting it.
+    records = {record.id: record for record in archived}
+    for row in live:
+        records[row.id] = SecurityLogRecord.from_row(row)
+    return sorted(records.values(), key=lambda r: (r.created_at, r.id))
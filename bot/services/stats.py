@@ -0,0 +1,34 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+from bot.db.repository import (
+    STAT_REVENUE_PREFIX,
+    STAT_SUBSCRIPTIONS_ACTIVE,
+    STAT_USERS_CREATED_PREFIX,
+    STAT_USERS_TOTAL,
+    get_stat_counters,
+)
+
+
+@dataclass(frozen=True)
+class AdminStats:
+    total_users: int
+    active_subs: int
+    revenue: int
+    users_today: int
+
+
+async def get_admin_stats() -> AdminStats:
+    today_key = STAT_USERS_CREATED_PREFIX + datetime.utcnow().strftime(
+        "%Y-%m-%d"
+    )
+    revenue_key = STAT_REVENUE_PREFIX + "XTR"
+    counters = await get_stat_counters(
+        [STAT_USERS_TOTAL, STAT_SUBSCRIPTIONS_ACTIVE, revenue_key, today_key]
+    )
+    return AdminStats(
+        total_users=counters[STAT_USERS_TOTAL],
+        active_subs=counters[STAT_SUBSCRIPTIONS_ACTIVE],
+        revenue=counters[revenue_key],
+        users_today=counters[today_key],
+    )
@@ -1,15 +1,19 @@
 import calendar
 from dataclasses import dataclass
-from datetime import datetime, timedelta
+from typing import Iterable
+from datetime import datetime
+
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.config import get_settings
-from bot.db.models import SecurityLog, User
+from bot.db.models import User
 from bot.db.repository import (
-    add_security_log,
+    get_subscription_status,
     get_user_by_hash,
     update_user_subscription,
 )
 from bot.security.crypto import encrypt_text, telegram_id_hash
+from bot.services.audit import audit_sink, write_security_logs
 from bot.services.tariffs import Tariff, get_tariff
 
 
@@ -39,10 +43,14 @@ def compute_new_end(current_end: datetime | None, months: int) -> datetime:
     return add_months(base, months)
 
 
-def ensure_user(telegram_id: int, username: str | None) -> User:
+async def ensure_user(
+    telegram_id: int,
+    username: str | None,
+    session: AsyncSession | None = None,
+) -> User:
     settings = get_settings()
     digest = telegram_id_hash(settings.app_secret, telegram_id)
-    user = get_user_by_hash(digest)
+    user = await get_user_by_hash(digest, session=session)
     if user:
         return user
     encrypted_id = encrypt_text(settings.fernet_key, str(telegram_id))
@@ -61,41 +69,48 @@ def ensure_user(telegram_id: int, username: str | None) -> User:
     )
     from bot.db.repository import upsert_user
 
-    return upsert_user(user)
+    return await upsert_user(user, session=session)
 
 
-def grant_subscription(
+async def grant_subscription(
     telegram_id: int,
     username: str | None,
     tariff_code: str,
+    session: AsyncSession | None = None,
+    user: User | None = None,
 ) -> SubscriptionUpdate:
     tariff = get_tariff(tariff_code)
-    user = ensure_user(telegram_id, username)
+    if user is None:
+        user = await ensure_user(telegram_id, username, session=session)
     new_end = compute_new_end(user.subscription_end, tariff.months)
-    update_user_subscription(user.id, new_end, tariff.code)
+    await update_user_subscription(
+        user.id,
+        new_end,
+        tariff.code,
+        session=session,
+    )
     return SubscriptionUpdate(user=user, new_end=new_end, tariff=tariff)
 
 
-def log_security_action(
+async def log_security_action(
     telegram_id: int | None,
     action: str,
     meta: str | None = None,
+    session: AsyncSession | None = None,
 ) -> None:
-    settings = get_settings()
-    if telegram_id is not None:
-        digest = telegram_id_hash(settings.app_secret, telegram_id)
-        encrypted_id = encrypt_text(settings.fernet_key, str(telegram_id))
-    else:
-        digest = None
-        encrypted_id = None
+    # Inside a transaction the record commits or rolls back with it;
+    # otherwise it goes through the buffered sink, off the request path.
+    if session is not None:
+        await write_security_logs([(telegram_id, action, meta)], session)
+        return
+    await audit_sink.log(telegram_id, action, meta)
 
-    log = SecurityLog(
-        telegram_id=encrypted_id,
-        telegram_id_hash=digest,
-        action=action,
-        meta=meta,
-    )
-    add_security_log(log)
+
+async def log_security_actions(
+    entries: Iterable[tuple[int | None, str, str | None]],
+    session: AsyncSession | None = None,
+) -> None:
+    await write_security_logs(entries, session=session)
 
 
 def days_left(subscription_end: datetime | None) -> int | None:
@@ -105,16 +120,14 @@ def days_left(subscription_end: datetime | None) -> int | None:
     return max(0, delta.days)
 
 
-def has_active_subscription(telegram_id: int) -> bool:
+async def has_active_subscription(
+    telegram_id: int,
+    session: AsyncSession | None = None,
+) -> bool:
     settings = get_settings()
     digest = telegram_id_hash(settings.app_secret, telegram_id)
-    user = get_user_by_hash(digest)
-    if user is None or user.subscription_end is None:
+    status = await get_subscription_status(digest, session=session)
+    if status is None or status.subscription_end is None:
         return False
-    return user.subscription_end > datetime.utcnow() and user.is_active
-
+    return status.subscription_end > datetime.utcnow() and status.is_active
 
-def reminder_window(days: int) -> tuple[datetime, datetime]:
-    start = datetime.utcnow() + timedelta(days=days)
-    end = start + timedelta(days=1)
-    return start, end
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any
+
+import httpx
+
+from bot.metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 10.0
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 0.2
+RETRY_MAX_DELAY = 2.0
+
+REQUEST_SECONDS = histogram(
+    "tinkoff_request_seconds",
+    "Tinkoff API call latency",
+    ("method", "outcome"),
+)
+RETRIES = counter(
+    "tinkoff_retries_total",
+    "Tinkoff API calls retried",
+    ("method",),
+)
+
+# Failures where the request provably never reached Tinkoff; retrying those
+# is safe even for calls that are not idempotent.
+_NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class TinkoffError(RuntimeError):
+    pass
+
+
+class TinkoffClient:
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_retries: int = MAX_RETRIES,
+        max_connections: int = 20,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        self.max_retries = max_retries
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=60.0,
+            ),
+            transport=transport,
+        )
+
+    async def call(
+        self,
+        method: str,
+        params: dict[str, Any],
+        idempotent: bool = False,
+        timeout: float | None = None,
+    ) -> dict[str, Any]:
+        if timeout is None:
+            timeout = httpx.USE_CLIENT_DEFAULT
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = await self._client.post(
+                    method,
+                    json=params,
+                    timeout=timeout,
+                )
+                if response.status_code >= 500:
+                    response.raise_for_status()
+            except httpx.HTTPError as exc:
+                REQUEST_SECONDS.observe(
+                    time.perf_counter() - started,
+                    method=method,
+                    outcome="error",
+                )
+                retryable = idempotent or isinstance(exc, _NOT_SENT)
+                if not retryable or attempt >= self.max_retries:
+                    raise TinkoffError("Tinkoff %s failed: %s" % (method, exc))
+                attempt += 1
+                RETRIES.inc(method=method)
+                await asyncio.sleep(_backoff(attempt))
+                continue
+
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=method,
+                outcome="ok" if response.is_success else "rejected",
+            )
+            if not response.is_success:
+                raise TinkoffError(
+                    "Tinkoff %s failed: HTTP %s"
+                    % (method, response.status_code)
+                )
+            data = response.json()
+            if not data.get("Success"):
+                raise TinkoffError(
+                    "Tinkoff %s failed: %s" % (method, data.get("Message"))
+                )
+            return data
+
+    async def init_payment(self, params: dict[str, str]) -> dict[str, Any]:
+        return await self.call("Init", params)
+
+    async def get_state(self, params: dict[str, str]) -> dict[str, Any]:
+        return await self.call("GetState", params, idempotent=True)
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter keeps concurrent retries from hitting Tinkoff in lockstep.
+    ceiling = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    return random.uniform(0, ceiling)
+
+
+_client: TinkoffClient | None = None
+
+
+def get_tinkoff_client() -> TinkoffClient:
+    global _client
+    if _client is None:
+        from bot.config import get_settings
+
+        _client = TinkoffClient(get_settings().tinkoff_api_url)
+    return _client
+
+
+async def close_tinkoff_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
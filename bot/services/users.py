@@ -1,15 +1,22 @@
 from datetime import datetime
 
+from cryptography.fernet import InvalidToken
+
 from bot.config import get_settings
 from bot.db.models import User
 from bot.db.repository import get_user_by_hash, upsert_user
-from bot.security.crypto import encrypt_text, telegram_id_hash
+from bot.security.crypto import (
+    decrypt_many,
+    decrypt_text,
+    encrypt_text,
+    telegram_id_hash,
+)
 
 
-def get_or_create_user(telegram_id: int, username: str | None) -> User:
+async def get_or_create_user(telegram_id: int, username: str | None) -> User:
     settings = get_settings()
     digest = telegram_id_hash(settings.app_secret, telegram_id)
-    existing = get_user_by_hash(digest)
+    existing = await get_user_by_hash(digest)
     if existing:
         return existing
     encrypted_id = encrypt_text(settings.fernet_key, str(telegram_id))
@@ -27,4 +34,21 @@ def get_or_create_user(telegram_id: int, username: str | None) -> User:
         is_active=True,
         created_at=datetime.utcnow(),
     )
-    return upsert_user(user)
+    return await upsert_user(user)
+
+
+def decrypt_telegram_ids(values: list[str]) -> list[int | None]:
+    # One batch pass for the common case; a single bad row only costs a
+    # per-item retry of its own chunk and comes back as None.
+    settings = get_settings()
+    try:
+        return [int(v) for v in decrypt_many(settings.fernet_key, values)]
+    except (InvalidToken, ValueError):
+        pass
+    telegram_ids = []
+    for value in values:
+        try:
+            telegram_ids.append(int(decrypt_text(settings.fernet_key, value)))
+        except (InvalidToken, ValueError):
+            telegram_ids.append(None)
+    return telegram_ids
@@ -1,9 +1,13 @@
+from sqlalchemy import create_engine
+
 from bot.config import get_settings
+from bot.db.migrations import upgrade
 from bot.db.session import init_db
 
 
 def main() -> None:
     settings = get_settings()
+    upgrade(create_engine(settings.database_url, future=True))
     init_db(settings.database_url)
     print(
         "Bot and web are not started yet. "
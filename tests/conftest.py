@@ -0,0 +1,88 @@
+import os
+import socket
+import threading
+import time
+
+import pytest
+from cryptography.fernet import Fernet
+
+# Settings are read from the environment on first use, so the test values
+# must be in place before anything from bot is imported.
+FAKE_TINKOFF_SECRET = "fake-secret"
+os.environ.update(
+    BOT_TOKEN="123456:test",
+    BOT_USERNAME="test_bot",
+    ADMIN_CHANNEL_ID="-1001",
+    FERNET_KEY=Fernet.generate_key().decode("utf-8"),
+    DATABASE_URL="sqlite+pysqlite:///:memory:",
+    WEBHOOK_BASE_URL="https://bot.test",
+    TINKOFF_TERMINAL_KEY="test-terminal",
+    TINKOFF_SECRET=FAKE_TINKOFF_SECRET,
+    ADMIN_PASSWORD_HASH="x",
+    ADMIN_PASSWORD_SALT="x",
+    APP_SECRET="test-app-secret",
+)
+
+import uvicorn  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+
+from bot.db.cache import subscription_cache  # noqa: E402
+from bot.db.migrations import upgrade  # noqa: E402
+from bot.db.session import AsyncSessionLocal, init_db  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+async def db(tmp_path):
+    url = "sqlite+pysqlite:///%s" % (tmp_path / "app.db")
+    engine = create_engine(url)
+    upgrade(engine)
+    engine.dispose()
+    init_db(url)
+    subscription_cache.clear()
+    yield
+    await AsyncSessionLocal.kw["bind"].dispose()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServerThread:
+    # Runs an ASGI app on a real socket, so client timeouts and connection
+    # errors behave as they do against the real API.
+    def __init__(self, app) -> None:
+        self.port = free_port()
+        self.server = uvicorn.Server(
+            uvicorn.Config(
+                app,
+                host="127.0.0.1",
+                port=self.port,
+                log_level="warning",
+                lifespan="off",
+            )
+        )
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:%s" % self.port
+
+    def __enter__(self) -> "ServerThread":
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Server did not start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.should_exit = True
+        self.thread.join(10)
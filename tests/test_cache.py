@@ -0,0 +1,22 @@
+from bot.db.cache import CACHE_ENTRIES, CACHE_LOOKUPS, MISSING, TTLCache
+
+
+def test_ttl_cache_exports_lookups_and_size():
+    now = [0.0]
+    cache = TTLCache("test", 10, 5.0, clock=lambda: now[0])
+
+    assert cache.get("a") is MISSING
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    cache.set("b", 2)
+
+    assert CACHE_LOOKUPS.value(cache="test", result="hit") == 1
+    assert CACHE_LOOKUPS.value(cache="test", result="miss") == 1
+    assert CACHE_ENTRIES.value(cache="test") == 2
+
+    cache.invalidate("b")
+    now[0] = 10.0
+    assert cache.get("a") is MISSING
+
+    assert CACHE_LOOKUPS.value(cache="test", result="miss") == 2
+    assert CACHE_ENTRIES.value(cache="test") == 0
@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from bot.db.repository import acquire_job_lease
+from bot.scheduler import coordination, jobs
+from bot.scheduler.coordination import LeaseLost, run_leased
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def lose_leases(monkeypatch):
+    # Every renewal fails, as if another worker had taken the lease over.
+    async def refuse(name, worker_id, until):
+        return False
+
+    monkeypatch.setattr(coordination, "HEARTBEAT_SECONDS", 0.05)
+    monkeypatch.setattr(coordination, "extend_job_lease", refuse)
+
+
+async def slow_job() -> int:
+    await asyncio.sleep(10)
+    return 1
+
+
+async def test_run_leased_returns_the_job_result(db):
+    async def job(value: int) -> int:
+        return value * 2
+
+    assert await run_leased("double", timedelta(0), job, 21) == 42
+
+
+async def test_run_leased_skips_a_lease_held_elsewhere(db):
+    calls = []
+
+    async def job() -> None:
+        calls.append(1)
+
+    now = datetime.utcnow()
+    await acquire_job_lease("busy", "other", now, now + timedelta(minutes=1))
+
+    assert await run_leased("busy", timedelta(0), job) is None
+    assert calls == []
+
+
+async def test_lost_lease_raises_without_cancelling_the_caller(
+    db,
+    lose_leases,
+):
+    with pytest.raises(LeaseLost):
+        await run_leased("lost", timedelta(0), slow_job)
+    # The caller's task is untouched and can keep awaiting.
+    await asyncio.sleep(0.01)
+    assert asyncio.current_task().cancelling() == 0
+
+
+async def test_cancelling_the_caller_cancels_the_job(db):
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def job() -> None:
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    task = asyncio.create_task(run_leased("stop", timedelta(0), job))
+    await started.wait()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await asyncio.wait_for(task, 1)
+    assert cancelled.is_set()
+
+
+async def test_expiry_watcher_survives_a_lost_lease(
+    db,
+    lose_leases,
+    monkeypatch,
+):
+    async def no_due(after):
+        return None
+
+    monkeypatch.setattr(jobs, "_sweep_expired", lambda *args: slow_job())
+    monkeypatch.setattr(jobs, "get_next_subscription_end", no_due)
+    monkeypatch.setattr(jobs, "EXPIRY_MAX_SLEEP", timedelta(seconds=0.05))
+    watcher = jobs.ExpiryWatcher()
+    watcher.start(None)
+
+    await asyncio.sleep(0.5)
+    alive = not watcher._task.done()
+    await asyncio.wait_for(watcher.stop(), 1)
+
+    assert alive
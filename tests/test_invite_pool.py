@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from bot.db.models import Invite
+from bot.db.repository import (
+    add_pooled_invites,
+    claim_pooled_invite,
+    count_pooled_invites,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def pooled(db):
+    now = datetime.utcnow()
+    await add_pooled_invites(
+        [
+            {
+                "invite_link": "https://t.me/+pooled",
+                "expires_at": now + timedelta(minutes=30),
+            }
+        ]
+    )
+    return now
+
+
+async def test_claim_saves_the_invite_with_the_pooled_link(pooled):
+    invite = Invite(telegram_id="x", telegram_id_hash="h", is_used=False)
+
+    claimed = await claim_pooled_invite(pooled, invite)
+
+    assert claimed is invite
+    assert invite.id is not None
+    assert invite.invite_link == "https://t.me/+pooled"
+    assert await count_pooled_invites(pooled) == 0
+
+
+async def test_failed_save_returns_the_link_to_the_pool(pooled):
+    invite = Invite(telegram_id=None, telegram_id_hash="h", is_used=False)
+
+    with pytest.raises(IntegrityError):
+        await claim_pooled_invite(pooled, invite)
+
+    assert await count_pooled_invites(pooled) == 1
@@ -0,0 +1,210 @@
+import json
+from urllib.parse import urlsplit
+
+import httpx
+import pytest
+
+from bot.config import get_settings
+from bot.db import repository
+from bot.db.cache import RecentKeys
+from bot.security.crypto import telegram_id_hash
+from bot.services import payments
+from bot.services.payments import (
+    build_tinkoff_init_payload,
+    build_tinkoff_token,
+    create_tinkoff_payment_link,
+    process_tinkoff_webhook,
+)
+from bot.services.tariffs import get_tariff
+from bot.services.tinkoff import RETRIES, TinkoffClient, TinkoffError
+from tests.conftest import ServerThread, free_port
+from web.fake_tinkoff import create_app
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeTinkoff:
+    def __init__(self) -> None:
+        self.notifications: list[dict] = []
+        app = create_app(
+            get_settings().tinkoff_secret,
+            notify_transport=httpx.MockTransport(self._capture),
+        )
+        self.server = ServerThread(app)
+
+    async def _capture(self, request: httpx.Request) -> httpx.Response:
+        self.notifications.append(json.loads(request.content))
+        return httpx.Response(200, json={"ok": True})
+
+    @property
+    def api_url(self) -> str:
+        return self.server.url + "/v2/"
+
+    def control(self, path: str, **params) -> dict:
+        response = httpx.post(self.server.url + path, params=params)
+        response.raise_for_status()
+        return response.json()
+
+
+@pytest.fixture
+def fake_tinkoff():
+    fake = FakeTinkoff()
+    with fake.server:
+        yield fake
+
+
+@pytest.fixture
+async def client(fake_tinkoff):
+    client = TinkoffClient(fake_tinkoff.api_url, timeout=0.5)
+    yield client
+    await client.aclose()
+
+
+def init_params(telegram_id: int = 42) -> dict[str, str]:
+    return build_tinkoff_init_payload(telegram_id, get_tariff("1m"))
+
+
+def test_token_matches_tinkoff_reference_example():
+    # The worked example from Tinkoff's token documentation; nested
+    # objects such as Receipt are left out of the signature.
+    params = {
+        "TerminalKey": "MerchantTerminalKey",
+        "Amount": 19200,
+        "OrderId": "21090",
+        "Description": "Подарочная карта на 1000 рублей",
+        "Receipt": {"Email": "a@test.ru"},
+    }
+
+    assert build_tinkoff_token(params, "usaf8fw8fsw21g") == (
+        "0024a00af7c350a3a67ca168ce06502aa72772456662e38696d48b56ee9c97d9"
+    )
+
+
+def test_token_signs_json_booleans_in_lowercase():
+    params = {"OrderId": "1", "Success": True}
+
+    assert build_tinkoff_token(params, "secret") == build_tinkoff_token(
+        {"OrderId": "1", "Success": "true"},
+        "secret",
+    )
+
+
+async def test_init_returns_payment_url(client):
+    data = await client.init_payment(init_params())
+
+    assert data["Success"] is True
+    assert data["PaymentURL"].startswith("https://fake.tinkoff.local/pay/")
+
+
+async def test_init_rejects_bad_token(client):
+    params = init_params()
+    params["Amount"] = "1"
+
+    with pytest.raises(TinkoffError, match="Bad token"):
+        await client.init_payment(params)
+
+
+async def test_get_state_retries_on_5xx(client, fake_tinkoff):
+    data = await client.init_payment(init_params())
+    retries = RETRIES.value(method="GetState")
+    fake_tinkoff.control("/_fake/fail", count=2)
+
+    state = await client.get_state(
+        {"TerminalKey": "test-terminal", "PaymentId": data["PaymentId"]}
+    )
+
+    assert state["Status"] == "NEW"
+    assert RETRIES.value(method="GetState") == retries + 2
+
+
+async def test_get_state_retries_on_timeout(client, fake_tinkoff):
+    data = await client.init_payment(init_params())
+    retries = RETRIES.value(method="GetState")
+    fake_tinkoff.control("/_fake/delay", seconds=1.0)
+
+    state = await client.get_state(
+        {"TerminalKey": "test-terminal", "PaymentId": data["PaymentId"]}
+    )
+
+    assert state["Status"] == "NEW"
+    assert RETRIES.value(method="GetState") == retries + 1
+
+
+async def test_init_is_not_retried_on_5xx(client, fake_tinkoff):
+    # Init is not idempotent: a 5xx may have created the payment, so it
+    # must surface instead of being sent again.
+    retries = RETRIES.value(method="Init")
+    fake_tinkoff.control("/_fake/fail", count=1)
+
+    with pytest.raises(TinkoffError, match="503"):
+        await client.init_payment(init_params())
+    assert RETRIES.value(method="Init") == retries
+    assert (await client.init_payment(init_params()))["Success"] is True
+
+
+async def test_init_is_not_retried_on_read_timeout(client, fake_tinkoff):
+    retries = RETRIES.value(method="Init")
+    fake_tinkoff.control("/_fake/delay", seconds=1.0)
+
+    with pytest.raises(TinkoffError):
+        await client.init_payment(init_params())
+    assert RETRIES.value(method="Init") == retries
+
+
+async def test_init_retries_when_not_sent():
+    # A refused connection never reached Tinkoff, so even Init retries.
+    client = TinkoffClient(
+        "http://127.0.0.1:%s/v2/" % free_port(),
+        max_retries=2,
+    )
+    retries = RETRIES.value(method="Init")
+    try:
+        with pytest.raises(TinkoffError):
+            await client.init_payment(init_params())
+    finally:
+        await client.aclose()
+    assert RETRIES.value(method="Init") == retries + 2
+
+
+async def test_webhook_rejects_bad_token(db):
+    params = {
+        "TerminalKey": "test-terminal",
+        "OrderId": "sub_1m_0000000000000000",
+        "Status": "CONFIRMED",
+        "Token": "forged",
+    }
+
+    result = await process_tinkoff_webhook(params)
+
+    assert result.ok is False
+    assert result.message == "Invalid token"
+
+
+async def test_duplicate_confirmed_grants_once(
+    db,
+    client,
+    fake_tinkoff,
+    monkeypatch,
+):
+    monkeypatch.setattr(payments, "get_tinkoff_client", lambda: client)
+    url = await create_tinkoff_payment_link(42, get_tariff("1m"))
+    payment_id = urlsplit(url).path.rsplit("/", 1)[-1]
+    fake_tinkoff.control("/_fake/confirm/%s" % payment_id)
+    [notification] = fake_tinkoff.notifications
+    # Sent the way the real API sends it, with JSON types intact.
+    assert notification["Success"] is True
+    digest = telegram_id_hash(get_settings().app_secret, 42)
+
+    first = await process_tinkoff_webhook(notification)
+    granted = await repository.get_subscription_status(digest)
+    second = await process_tinkoff_webhook(notification)
+    # A fresh process has an empty recent-keys filter; the database claim
+    # must still reject the repeat.
+    monkeypatch.setattr(repository, "recent_payment_keys", RecentKeys(10))
+    third = await process_tinkoff_webhook(notification)
+
+    assert (first.message, first.telegram_id) == ("Paid", 42)
+    assert second.message == "Duplicate"
+    assert third.message == "Duplicate"
+    status = await repository.get_subscription_status(digest)
+    assert status.subscription_end == granted.subscription_end
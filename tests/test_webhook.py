@@ -0,0 +1,55 @@
+import httpx
+import pytest
+
+from bot.config import get_settings
+from web.app import SECRET_HEADER, TELEGRAM_WEBHOOK_PATH, app, lifespan
+
+pytestmark = pytest.mark.anyio
+
+UPDATE = {"update_id": 1}
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "telegram_webhook_enabled", True)
+    monkeypatch.setattr(settings, "telegram_webhook_secret", "s3cret")
+    return settings
+
+
+async def post_update(headers: dict[str, str] | None = None) -> int:
+    # No lifespan: rejected requests must never reach the dispatcher.
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport,
+        base_url="http://test",
+    ) as client:
+        response = await client.post(
+            TELEGRAM_WEBHOOK_PATH,
+            json=UPDATE,
+            headers=headers,
+        )
+    return response.status_code
+
+
+async def test_webhook_is_not_found_when_disabled(settings, monkeypatch):
+    monkeypatch.setattr(settings, "telegram_webhook_enabled", False)
+
+    assert await post_update({SECRET_HEADER: "s3cret"}) == 404
+
+
+async def test_webhook_rejects_missing_secret_header(settings):
+    assert await post_update() == 401
+
+
+async def test_webhook_rejects_wrong_secret(settings):
+    assert await post_update({SECRET_HEADER: "guess"}) == 401
+
+
+async def test_webhook_requires_a_configured_secret(settings, monkeypatch):
+    monkeypatch.setattr(settings, "telegram_webhook_secret", None)
+
+    assert await post_update({SECRET_HEADER: ""}) == 401
+    with pytest.raises(RuntimeError, match="TELEGRAM_WEBHOOK_SECRET"):
+        async with lifespan(app):
+            pass
@@ -1,13 +1,89 @@
+import asyncio
+import hmac
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 
-from aiogram import Bot
+from aiogram.types import Update
 
 from bot.config import get_settings
-from bot.services.invites import issue_invite_link
-from bot.services.payments import process_tinkoff_webhook
+from bot.db.session import init_db
+from bot.main import build_bot, build_dispatcher
+from bot.metrics import CONTENT_TYPE, REGISTRY
+from bot.scheduler.jobs import expiry_watcher, start_scheduler
+from bot.services.audit import audit_sink
+from bot.services.broadcast import resume_broadcasts
+from bot.services.inbox import TinkoffInbox, enqueue_tinkoff_notification
+from bot.services.invite_pool import invite_pool
+from bot.services.payments import verify_tinkoff_signature
+from bot.services.tinkoff import close_tinkoff_client
+
+TELEGRAM_WEBHOOK_PATH = "/webhook/telegram"
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Updates handled at once; further webhook deliveries wait for a slot, which
+# bounds concurrent handler transactions and pushes back on Telegram.
+UPDATE_CONCURRENCY = 32
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Telegram updates and Tinkoff notifications share one Bot (and so one
+    # pooled HTTP session) for the lifetime of the process.
+    settings = get_settings()
+    if (
+        settings.telegram_webhook_enabled
+        and not settings.telegram_webhook_secret
+    ):
+        # Without the secret anyone could post forged updates, including
+        # successful payments.
+        raise RuntimeError(
+            "TELEGRAM_WEBHOOK_ENABLED requires TELEGRAM_WEBHOOK_SECRET"
+        )
+    init_db(settings.database_url)
+    bot = build_bot()
+    dp = build_dispatcher()
+    app.state.bot = bot
+    app.state.dp = dp
+    app.state.update_tasks = set()
+    app.state.update_slots = asyncio.Semaphore(UPDATE_CONCURRENCY)
+
+    await audit_sink.start()
+    scheduler = await start_scheduler(bot)
+    await resume_broadcasts(bot)
+    await invite_pool.start(bot)
+    inbox = TinkoffInbox(bot)
+    await inbox.start()
+    app.state.tinkoff_inbox = inbox
+    # Opt-in: the polling entrypoint deletes the webhook on start, so only
+    # the deployment that receives Telegram updates here should set it.
+    if settings.telegram_webhook_enabled:
+        await bot.set_webhook(
+            settings.webhook_base_url.rstrip("/") + TELEGRAM_WEBHOOK_PATH,
+            secret_token=settings.telegram_webhook_secret,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+    try:
+        yield
+    finally:
+        scheduler.shutdown(wait=False)
+        await expiry_watcher.stop()
+        await inbox.stop()
+        await invite_pool.stop()
+        if app.state.update_tasks:
+            await asyncio.gather(
+                *app.state.update_tasks,
+                return_exceptions=True,
+            )
+        await audit_sink.stop()
+        await bot.session.close()
+        await close_tinkoff_client()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.get("/health")
@@ -15,30 +91,66 @@ async def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.post(TELEGRAM_WEBHOOK_PATH)
+async def telegram_webhook(request: Request) -> JSONResponse:
+    settings = get_settings()
+    if not settings.telegram_webhook_enabled:
+        return JSONResponse({"ok": False}, status_code=404)
+    secret = settings.telegram_webhook_secret or ""
+    received = request.headers.get(SECRET_HEADER, "")
+    if not secret or not hmac.compare_digest(
+        received.encode("utf-8"),
+        secret.encode("utf-8"),
+    ):
+        return JSONResponse({"ok": False}, status_code=401)
+
+    bot = request.app.state.bot
+    update = Update.model_validate(await request.json(), context={"bot": bot})
+    # Acknowledge once a slot is free; the update is handled in the
+    # background so Telegram's delivery is not held up by handler latency.
+    slots = request.app.state.update_slots
+    await slots.acquire()
+    tasks = request.app.state.update_tasks
+    task = asyncio.create_task(request.app.state.dp.feed_update(bot, update))
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+    task.add_done_callback(lambda _: slots.release())
+    task.add_done_callback(_log_update_failure)
+    return JSONResponse({"ok": True})
+
+
+def _log_update_failure(task: asyncio.Task) -> None:
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        logger.error("Update handling failed", exc_info=exc)
+
+
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(
+        REGISTRY.render(),
+        media_type=CONTENT_TYPE,
+    )
+
+
 @app.post("/webhook/tinkoff")
 async def tinkoff_webhook(request: Request) -> JSONResponse:
+    # Only the cheap checks run inline; the event is persisted to the inbox
+    # and processed by TinkoffInbox workers, so Tinkoff gets its answer
+    # without waiting on the database grant or the Telegram API.
     payload = await request.json()
-    result = process_tinkoff_webhook(payload)
-    if not result.ok:
+    if not verify_tinkoff_signature(payload):
         return JSONResponse(
-            {"ok": False, "message": result.message},
+            {"ok": False, "message": "Invalid token"},
             status_code=400,
         )
-
-    if result.telegram_id and result.tariff:
-        settings = get_settings()
-        bot = Bot(token=settings.bot_token)
-        try:
-            invite = await issue_invite_link(bot, result.telegram_id, None)
-            await bot.send_message(
-                result.telegram_id,
-                (
-                    "Оплата принята. Доступ активирован на %s месяцев. "
-                    "Вот твой инвайт:\n%s"
-                )
-                % (result.tariff.months, invite),
-            )
-        finally:
-            await bot.session.close()
-
+    if not (payload.get("OrderId") or payload.get("OrderID")):
+        return JSONResponse(
+            {"ok": False, "message": "Missing OrderId"},
+            status_code=400,
+        )
+    await enqueue_tinkoff_notification(payload)
+    request.app.state.tinkoff_inbox.notify()
     return JSONResponse({"ok": True})
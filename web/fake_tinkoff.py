@@ -0,0 +1,141 @@
+"""In-memory stand-in for the Tinkoff acquiring API.
+
+Serves ``Init`` and ``GetState`` under ``/v2/`` with the same token scheme
+as the real API, so the bot can be exercised locally::
+
+    TINKOFF_API_URL=http://127.0.0.1:8081/v2/ \
+        uvicorn web.fake_tinkoff:app --port 8081
+
+``POST /_fake/fail`` makes the next ``count`` calls answer 503 and
+``POST /_fake/delay`` holds the next ``count`` calls for ``seconds`` (to
+exercise retries and timeouts). ``POST /_fake/confirm/{payment_id}``
+delivers a signed CONFIRMED notification to the payment's NotificationURL;
+tests pass ``notify_transport`` to capture it instead.
+"""
+import asyncio
+import itertools
+import os
+from typing import Any
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from bot.services.payments import build_tinkoff_token
+
+
+def create_app(
+    secret: str = "fake-secret",
+    notify_transport: httpx.AsyncBaseTransport | None = None,
+) -> FastAPI:
+    fake = FastAPI()
+    payments: dict[str, dict[str, Any]] = {}
+    payment_ids = itertools.count(1)
+    failures = {"remaining": 0}
+    delays = {"remaining": 0, "seconds": 0.0}
+
+    def signed(params: dict[str, Any]) -> dict[str, Any]:
+        params = {k: v for k, v in params.items() if k != "Token"}
+        params["Token"] = build_tinkoff_token(params, secret)
+        return params
+
+    async def should_fail() -> bool:
+        if delays["remaining"] > 0:
+            delays["remaining"] -= 1
+            await asyncio.sleep(delays["seconds"])
+        if failures["remaining"] > 0:
+            failures["remaining"] -= 1
+            return True
+        return False
+
+    @fake.post("/v2/Init")
+    async def init(request: Request) -> JSONResponse:
+        if await should_fail():
+            return JSONResponse({"Success": False}, status_code=503)
+        params = await request.json()
+        if params.get("Token") != build_tinkoff_token(params, secret):
+            return JSONResponse(
+                {"Success": False, "ErrorCode": "204", "Message": "Bad token"}
+            )
+        payment_id = str(next(payment_ids))
+        payments[payment_id] = {
+            "TerminalKey": params["TerminalKey"],
+            "OrderId": params["OrderId"],
+            "Amount": params["Amount"],
+            "Status": "NEW",
+            "NotificationURL": params.get("NotificationURL"),
+        }
+        return JSONResponse(
+            {
+                "Success": True,
+                "ErrorCode": "0",
+                "TerminalKey": params["TerminalKey"],
+                "Status": "NEW",
+                "PaymentId": payment_id,
+                "OrderId": params["OrderId"],
+                "Amount": int(params["Amount"]),
+                "PaymentURL": "https://fake.tinkoff.local/pay/%s" % payment_id,
+            }
+        )
+
+    @fake.post("/v2/GetState")
+    async def get_state(request: Request) -> JSONResponse:
+        if await should_fail():
+            return JSONResponse({"Success": False}, status_code=503)
+        params = await request.json()
+        payment = payments.get(str(params.get("PaymentId")))
+        if payment is None:
+            return JSONResponse(
+                {"Success": False, "ErrorCode": "7", "Message": "Not found"}
+            )
+        return JSONResponse(
+            {
+                "Success": True,
+                "ErrorCode": "0",
+                "PaymentId": params["PaymentId"],
+                "OrderId": payment["OrderId"],
+                "Status": payment["Status"],
+            }
+        )
+
+    @fake.post("/_fake/fail")
+    async def fail(count: int = 1) -> dict[str, int]:
+        failures["remaining"] = count
+        return {"remaining": count}
+
+    @fake.post("/_fake/delay")
+    async def delay(seconds: float, count: int = 1) -> dict[str, float]:
+        delays["remaining"] = count
+        delays["seconds"] = seconds
+        return {"remaining": count, "seconds": seconds}
+
+    @fake.post("/_fake/confirm/{payment_id}")
+    async def confirm(payment_id: str) -> JSONResponse:
+        payment = payments.get(payment_id)
+        if payment is None:
+            return JSONResponse({"ok": False}, status_code=404)
+        payment["Status"] = "CONFIRMED"
+        notification = signed(
+            {
+                "TerminalKey": payment["TerminalKey"],
+                "OrderId": payment["OrderId"],
+                "Success": True,
+                "Status": "CONFIRMED",
+                "PaymentId": int(payment_id),
+                "ErrorCode": "0",
+                "Amount": int(payment["Amount"]),
+            }
+        )
+        async with httpx.AsyncClient(transport=notify_transport) as client:
+            response = await client.post(
+                payment["NotificationURL"],
+                json=notification,
+            )
+        return JSONResponse(
+            {"ok": True, "notification_status": response.status_code}
+        )
+
+    return fake
+
+
+app = create_app(os.environ.get("TINKOFF_SECRET", "fake-secret"))